@@ -8,7 +8,7 @@ from app.i18n.state import set_language
 router = APIRouter(prefix="/api/auth", tags=["认证"])
 
 
-def get_current_user(x_user_id: str = Header(...), db: Session = Depends(get_db)) -> User:
+def _load_user(x_user_id: str = Header(...), db: Session = Depends(get_db)) -> User:
     """
     简化版认证：通过 X-User-ID header 获取用户
     Hackathon 阶段使用，后续替换为 Firebase Auth
@@ -20,10 +20,14 @@ def get_current_user(x_user_id: str = Header(...), db: Session = Depends(get_db)
         db.add(user)
         db.commit()
         db.refresh(user)
+    return user
 
-    # 按用户偏好设置当前请求的语言
-    set_language(user.language or "en")
 
+async def get_current_user(user: User = Depends(_load_user)) -> User:
+    """当前用户，并按用户偏好设置本请求的语言"""
+    # 同步依赖在线程池中执行，其中设置的 ContextVar 不会传回请求上下文；
+    # 异步依赖与路由函数运行在同一上下文，同步路由函数执行时也会复制到线程池
+    set_language(user.language or "en")
     return user
 
 
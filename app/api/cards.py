@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models.user import User
 from app.models.joy_card import JoyCard
-from app.schemas.joy_card import JoyCardResponse, JoyCardListResponse
+from app.schemas.joy_card import JoyCardResponse, JoyCardListResponse, JoyCardConversationResponse
+from app.services.card_service import CardService
+from app.services.chat_history import ChatHistoryService
 from app.api.auth import get_current_user
 
 router = APIRouter(prefix="/api/cards", tags=["快乐卡片"])
@@ -11,21 +14,28 @@ router = APIRouter(prefix="/api/cards", tags=["快乐卡片"])
 
 @router.get("", response_model=JoyCardListResponse)
 def get_cards(
-    skip: int = 0,
-    limit: int = 20,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """获取卡片列表"""
-    cards = db.query(JoyCard).filter(
-        JoyCard.user_id == user.id
-    ).order_by(JoyCard.created_at.desc()).offset(skip).limit(limit).all()
+    """
+    获取卡片列表
 
-    total = db.query(JoyCard).filter(JoyCard.user_id == user.id).count()
+    翻页时传入上一页返回的 next_cursor（此时忽略 skip）；skip/limit 仍然可用，但越往后越慢。
+    include_total=false 时不统计总数，total 返回 null
+    """
+    try:
+        cards, next_cursor = CardService.get_user_cards(db, user.id, skip, limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
 
     return {
         "cards": cards,
-        "total": total
+        "total": CardService.count_user_cards(db, user.id) if include_total else None,
+        "next_cursor": next_cursor
     }
 
 
@@ -47,6 +57,27 @@ def get_card(
     return card
 
 
+@router.get("/{card_id}/conversation", response_model=JoyCardConversationResponse)
+def get_card_conversation(
+    card_id: str,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """获取生成卡片的完整对话（按需读取，不随卡片返回）"""
+    card = db.query(JoyCard).filter(
+        JoyCard.id == card_id,
+        JoyCard.user_id == user.id
+    ).first()
+
+    if not card:
+        raise HTTPException(status_code=404, detail="卡片不存在")
+
+    return {
+        "card_id": card.id,
+        "messages": ChatHistoryService.load_for_card(db, card)
+    }
+
+
 @router.delete("/{card_id}")
 def delete_card(
     card_id: str,
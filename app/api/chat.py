@@ -1,14 +1,21 @@
+import json
+import uuid
+from typing import Dict, List, Optional, Tuple
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy.orm.exc import StaleDataError
+from app.database import get_db, SessionLocal
 from app.models.user import User
 from app.models.chat_session import ChatSession, SessionStatus, SessionType
+from app.models.chat_message import ChatMessage
 from app.models.joy_card import JoyCard
 from app.schemas.chat import (
     ChatStartResponse, ChatMessageRequest, ChatMessageResponse,
     ChatCompleteRequest, ChatCompleteResponse
 )
 from app.services.chat_service import ChatService
+from app.services.chat_history import ChatHistoryService
 from app.api.auth import get_current_user
 
 router = APIRouter(prefix="/api/chat", tags=["对话"])
@@ -20,28 +27,27 @@ def start_chat(
     db: Session = Depends(get_db)
 ):
     """开始新的对话"""
-    session = ChatSession(
-        user_id=user.id,
-        session_type=SessionType.CARD_CREATION,
-        messages=[]
-    )
-    db.add(session)
-    db.commit()
-    db.refresh(session)
-
     result = ChatService.start_conversation()
 
-    session.messages = [{"role": "assistant", "content": result["initial_message"]}]
+    # 会话与开场白在同一个事务中写入；id 预先生成，提交后无需 refresh
+    session_id = str(uuid.uuid4())
+    db.add(ChatSession(
+        id=session_id,
+        user_id=user.id,
+        session_type=SessionType.CARD_CREATION,
+        message_count=1,
+        chat_messages=[ChatMessage(seq=0, role="assistant", content=result["initial_message"])]
+    ))
     db.commit()
 
     return {
-        "session_id": session.id,
+        "session_id": session_id,
         "initial_message": result["initial_message"]
     }
 
 
 @router.post("/message", response_model=ChatMessageResponse)
-def send_message(
+async def send_message(
     request: ChatMessageRequest,
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -58,70 +64,192 @@ def send_message(
     if session.status != SessionStatus.ACTIVE:
         raise HTTPException(status_code=400, detail="chat ended")
 
-    result = ChatService.process_message(session.messages, request.message)
-    session.messages = result["updated_history"]
+    # 读取完毕即归还连接：等待 AI 的数秒内不占用连接池，也不持有 SQLite 事务
+    session_id, user_id, version = session.id, user.id, session.version
+    history, summary = ChatHistoryService.load(db, session_id), session.summary
+    db.close()
+
+    result = await ChatService.aprocess_message(history, request.message, summary, user_id=user_id)
+
+    # 短写事务（db 关闭后可继续使用，会重新取连接）
+    is_complete, card_data = _save_turn(db, session_id, user_id, version, result)
+
+    return {
+        "ai_response": result["assistant_reply"],
+        "is_complete": is_complete,
+        "card": card_data
+    }
+
+
+@router.post("/message/stream")
+async def send_message_stream(
+    request: ChatMessageRequest,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    发送消息（SSE 流式返回）
+
+    事件：
+        delta  {"text": "..."}                 回复片段，公式 JSON 块不会下发
+        done   同 /message 的返回结构           公式在流结束后解析，并创建/更新草稿卡片
+        error  {"detail": "..."}
+    """
+    session = db.query(ChatSession).filter(
+        ChatSession.id == request.session_id,
+        ChatSession.user_id == user.id
+    ).first()
+
+    if not session:
+        raise HTTPException(status_code=404, detail="chat not existed")
+
+    if session.status != SessionStatus.ACTIVE:
+        raise HTTPException(status_code=400, detail="chat ended")
+
+    # 请求级 db 会在响应开始前关闭，流结束后的写入使用独立的 session
+    session_id, user_id, version = session.id, user.id, session.version
+    history, summary = ChatHistoryService.load(db, session_id), session.summary
+
+    async def event_stream():
+        try:
+            result = None
+            async for event in ChatService.astream_message(history, request.message, summary, user_id=user_id):
+                if event["type"] == "delta":
+                    yield _sse("delta", {"text": event["text"]})
+                else:
+                    result = event["result"]
+
+            write_db = SessionLocal()
+            try:
+                is_complete, card_data = _save_turn(write_db, session_id, user_id, version, result)
+            finally:
+                write_db.close()
+
+            yield _sse("done", {
+                "ai_response": result["assistant_reply"],
+                "is_complete": is_complete,
+                "card": card_data
+            })
+        except HTTPException as e:
+            yield _sse("error", {"detail": e.detail})
+        except Exception as e:
+            print(f"流式对话失败: {str(e)}")
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _sse(event: str, data: Dict) -> str:
+    """格式化一条 SSE 事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _save_turn(db: Session, session_id: str, user_id: str, version: int,
+               result: Dict) -> Tuple[bool, Optional[Dict]]:
+    """
+    保存一轮对话结果（短写事务），检测到公式时创建/更新草稿卡片（但不结束会话）
+
+    version 为读取会话时的版本号；会话在 AI 调用期间被其他请求修改（并发发送、已结束）时返回 409
 
-    # 如果检测到公式，创建/更新草稿卡片（但不结束会话）
+    Returns:
+        (会话是否已有卡片草稿, 本轮卡片数据)
+    """
+    session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+    if session is None or session.version != version:
+        raise _conflict()
+
+    # 只追加本轮新增的消息（用户消息 + AI 回复）
+    messages = result["updated_history"]
+    new_messages = messages[session.message_count:]
+    ChatHistoryService.append(db, session, new_messages)
+    if "summary" in result:
+        session.summary = result["summary"]
+
+    new_inputs = [msg["content"] for msg in new_messages if msg["role"] == "user"]
     card_data = None
-    has_card_draft = False
     if result["is_complete"]:
-        formula_result = result["formula"]
-        formula = formula_result["formula"]
-        card_summary = formula_result["card_summary"]
-        all_user_inputs = "\n".join(
-            msg["content"] for msg in session.messages if msg["role"] == "user"
+        card = _upsert_draft_card(db, session, user_id, result["formula"], messages, new_inputs)
+        card_data = _card_payload(card)
+    elif session.joy_card_id and new_inputs:
+        # 草稿已存在时，本轮的用户发言直接追加到卡片原话末尾
+        db.query(JoyCard).filter(JoyCard.id == session.joy_card_id).update(
+            {"raw_input": JoyCard.raw_input + "\n" + "\n".join(new_inputs)},
+            synchronize_session=False
         )
 
-        # 查找已有的草稿卡片
-        existing_card = None
-        if session.joy_card_id:
-            existing_card = db.query(JoyCard).filter(JoyCard.id == session.joy_card_id).first()
-
-        if existing_card:
-            existing_card.raw_input = all_user_inputs
-            existing_card.formula_scene = formula.get("scene")
-            existing_card.formula_people = formula.get("people")
-            existing_card.formula_event = formula.get("event")
-            existing_card.formula_trigger = formula.get("trigger")
-            existing_card.formula_sensation = formula.get("sensation")
-            existing_card.card_summary = card_summary
-            existing_card.conversation_history = session.messages
-            card = existing_card
-        else:
-            card = JoyCard(
-                user_id=user.id,
-                raw_input=all_user_inputs,
-                formula_scene=formula.get("scene"),
-                formula_people=formula.get("people"),
-                formula_event=formula.get("event"),
-                formula_trigger=formula.get("trigger"),
-                formula_sensation=formula.get("sensation"),
-                card_summary=card_summary,
-                conversation_history=session.messages
-            )
-            db.add(card)
-            db.flush()
-            session.joy_card_id = card.id
-
-        has_card_draft = True
-        card_data = {
-            "id": card.id,
-            "summary": card.card_summary,
-            "formula": {
-                "scene": card.formula_scene,
-                "people": card.formula_people,
-                "event": card.formula_event,
-                "trigger": card.formula_trigger,
-                "sensation": card.formula_sensation
-            }
-        }
+    try:
+        # UPDATE ... WHERE version = ?：读取之后到提交之间被修改同样视为冲突
+        db.commit()
+    except StaleDataError:
+        db.rollback()
+        raise _conflict()
+
+    return card_data is not None or session.joy_card_id is not None, card_data
+
+
+def _conflict() -> HTTPException:
+    return HTTPException(status_code=409, detail="会话已被其他请求修改，请刷新后重试")
+
+
+def _upsert_draft_card(db: Session, session: ChatSession, user_id: str, formula_result: Dict,
+                       messages: List[Dict], new_inputs: List[str]) -> JoyCard:
+    """
+    根据公式结果创建或更新会话的草稿卡片
+
+    卡片只引用会话（session_id），不复制对话历史。新建时由完整历史 messages 拼出 raw_input，
+    之后每轮只把本轮的用户发言 new_inputs 追加到末尾
+    """
+    formula = formula_result["formula"]
+    card_summary = formula_result["card_summary"]
+
+    # 查找已有的草稿卡片
+    existing_card = None
+    if session.joy_card_id:
+        existing_card = db.query(JoyCard).filter(JoyCard.id == session.joy_card_id).first()
+
+    if existing_card:
+        existing_card.raw_input = "\n".join([existing_card.raw_input] + new_inputs)
+        existing_card.formula_scene = formula.get("scene")
+        existing_card.formula_people = formula.get("people")
+        existing_card.formula_event = formula.get("event")
+        existing_card.formula_trigger = formula.get("trigger")
+        existing_card.formula_sensation = formula.get("sensation")
+        existing_card.card_summary = card_summary
+        return existing_card
+
+    card = JoyCard(
+        user_id=user_id,
+        session_id=session.id,
+        raw_input="\n".join(msg["content"] for msg in messages if msg["role"] == "user"),
+        formula_scene=formula.get("scene"),
+        formula_people=formula.get("people"),
+        formula_event=formula.get("event"),
+        formula_trigger=formula.get("trigger"),
+        formula_sensation=formula.get("sensation"),
+        card_summary=card_summary
+    )
+    db.add(card)
+    db.flush()
+    session.joy_card_id = card.id
+    return card
 
-    db.commit()
 
+def _card_payload(card: JoyCard) -> Dict:
+    """卡片在对话接口中的返回结构"""
     return {
-        "ai_response": result["assistant_reply"],
-        "is_complete": has_card_draft or session.joy_card_id is not None,
-        "card": card_data
+        "id": card.id,
+        "summary": card.card_summary,
+        "formula": {
+            "scene": card.formula_scene,
+            "people": card.formula_people,
+            "event": card.formula_event,
+            "trigger": card.formula_trigger,
+            "sensation": card.formula_sensation
+        }
     }
 
 
@@ -168,69 +296,20 @@ async def send_voice_message(
     if session.status != SessionStatus.ACTIVE:
         raise HTTPException(status_code=400, detail="会话已结束")
 
+    # 与文本消息相同：读取后归还连接，AI 调用结束再短事务写入
+    session_id, user_id, version = session.id, user.id, session.version
+    history = ChatHistoryService.load(db, session_id)
+    db.close()
+
     # 调用语音处理（单次 Gemini API 调用）
-    result = ChatService.process_voice_message(
-        session.messages, audio_bytes, content_type
-    )
-    session.messages = result["updated_history"]
+    result = ChatService.process_voice_message(history, audio_bytes, content_type)
 
     # 复用与文本消息相同的卡片创建逻辑
-    card_data = None
-    has_card_draft = False
-    if result["is_complete"]:
-        formula = result["formula"]["formula"]
-        all_user_inputs = "\n".join(
-            msg["content"] for msg in session.messages if msg["role"] == "user"
-        )
-
-        existing_card = None
-        if session.joy_card_id:
-            existing_card = db.query(JoyCard).filter(JoyCard.id == session.joy_card_id).first()
-
-        if existing_card:
-            existing_card.raw_input = all_user_inputs
-            existing_card.formula_scene = formula.get("scene")
-            existing_card.formula_people = formula.get("people")
-            existing_card.formula_event = formula.get("event")
-            existing_card.formula_trigger = formula.get("trigger")
-            existing_card.formula_sensation = formula.get("sensation")
-            existing_card.card_summary = result["formula"]["card_summary"]
-            existing_card.conversation_history = session.messages
-            card = existing_card
-        else:
-            card = JoyCard(
-                user_id=user.id,
-                raw_input=all_user_inputs,
-                formula_scene=formula.get("scene"),
-                formula_people=formula.get("people"),
-                formula_event=formula.get("event"),
-                formula_trigger=formula.get("trigger"),
-                formula_sensation=formula.get("sensation"),
-                card_summary=result["formula"]["card_summary"],
-                conversation_history=session.messages
-            )
-            db.add(card)
-            db.flush()
-            session.joy_card_id = card.id
-
-        has_card_draft = True
-        card_data = {
-            "id": card.id,
-            "summary": card.card_summary,
-            "formula": {
-                "scene": card.formula_scene,
-                "people": card.formula_people,
-                "event": card.formula_event,
-                "trigger": card.formula_trigger,
-                "sensation": card.formula_sensation
-            }
-        }
-
-    db.commit()
+    has_card_draft, card_data = _save_turn(db, session_id, user_id, version, result)
 
     return {
         "assistant_reply": result["assistant_reply"],
-        "has_card_draft": has_card_draft or session.joy_card_id is not None,
+        "has_card_draft": has_card_draft,
         "is_complete": False,
         "card_data": card_data,
         "transcribed_text": result["transcribed_text"]
@@ -258,16 +337,11 @@ def complete_chat(
     if not session.joy_card_id:
         raise HTTPException(status_code=400, detail="还没有生成卡片草稿，请继续对话")
 
-    # 最终更新卡片
+    # 卡片的 raw_input 每轮已增量更新，对话历史通过 session_id 引用，结束时无需再写卡片
     card = db.query(JoyCard).filter(JoyCard.id == session.joy_card_id).first()
-    card.raw_input = "\n".join(
-        msg["content"] for msg in session.messages if msg["role"] == "user"
-    )
-    card.conversation_history = session.messages
 
     session.status = SessionStatus.COMPLETED
     db.commit()
-    db.refresh(card)
 
     return {
         "message": "卡片已保存",
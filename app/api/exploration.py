@@ -6,13 +6,14 @@ from app.models.joy_card import JoyCard
 from app.models.joy_insight import JoyInsight
 from app.schemas.exploration import ExplorationRequest, ExplorationResponse
 from app.services.exploration_service import ExplorationService
+from app.services.ai_retry import CircuitOpenError
 from app.api.auth import get_current_user
 
 router = APIRouter(prefix="/api/exploration", tags=["快乐盲盒"])
 
 
 @router.post("/recommend", response_model=ExplorationResponse)
-def get_recommendations(
+async def get_recommendations(
     request: ExplorationRequest,
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -33,13 +34,19 @@ def get_recommendations(
             detail="数据不足，需要至少3张快乐卡片或1条快乐定律"
         )
 
+    # 数据已读出，生成推荐前归还连接（AI 调用期间不占用连接池）
+    db.close()
+
     # 生成推荐
     try:
-        recommendations = ExplorationService.recommend(
+        recommendations = await ExplorationService.arecommend_cached(
+            user_id=user.id,
             energy_level=request.energy_level,
             insights=insights,
             recent_cards=recent_cards
         )
+    except CircuitOpenError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"推荐失败: {str(e)}")
 
@@ -1,72 +1,173 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.database import get_db
+import json
+from typing import Dict, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, undefer
+from app.database import get_db, SessionLocal
 from app.models.user import User
 from app.models.joy_card import JoyCard
 from app.models.joy_insight import JoyInsight
-from app.schemas.joy_insight import JoyInsightResponse, GenerateInsightsResponse
+from app.models.insight_job import InsightJob
+from app.schemas.joy_insight import JoyInsightResponse, InsightJobResponse
 from app.services.insight_service import InsightService
+from app.services.insight_job_service import InsightJobService
+from app.services.pagination import keyset_page
 from app.api.auth import get_current_user
 
 router = APIRouter(prefix="/api/insights", tags=["快乐定律"])
 
+# 列表只查询 JoyInsightResponse 需要的列
+_LIST_COLUMNS = tuple(getattr(JoyInsight, name) for name in JoyInsightResponse.model_fields)
 
-@router.post("/generate", response_model=GenerateInsightsResponse)
-def generate_insights(
+
+@router.post("/generate", response_model=InsightJobResponse, status_code=202)
+async def generate_insights(
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """生成快乐定律"""
-    # 获取用户的所有卡片
-    cards = db.query(JoyCard).filter(JoyCard.user_id == user.id).all()
+    """
+    提交快乐定律生成任务（后台执行）
 
-    if len(cards) < 5:
+    立即返回 202 和任务，通过 GET /api/insights/jobs/{job_id} 查询进度和结果。
+    同一用户已有排队或执行中的任务时返回该任务。
+    """
+    card_count = db.query(JoyCard).filter(JoyCard.user_id == user.id).count()
+
+    if card_count < 5:
         raise HTTPException(
             status_code=400,
-            detail=f"需要至少5张卡片才能生成定律，当前有{len(cards)}张"
+            detail=f"需要至少5张卡片才能生成定律，当前有{card_count}张"
         )
 
-    # 生成定律
-    try:
-        insights_data = InsightService.generate_insights(cards)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"生成失败: {str(e)}")
-
-    # 保存定律
-    created_insights = []
-    for insight_data in insights_data:
-        insight = JoyInsight(
-            user_id=user.id,
-            insight_text=insight_data["insight"],
-            statement=insight_data.get("statement"),
-            keywords=insight_data.get("keywords"),
-            pattern_type=insight_data.get("pattern_type"),
-            evidence_cards=insight_data.get("evidence", [])
-        )
-        db.add(insight)
-        created_insights.append(insight)
+    job = InsightJobService.enqueue(db, user.id)
+    return _job_payload(db, job)
 
-    db.commit()
 
-    for insight in created_insights:
-        db.refresh(insight)
+@router.get("/jobs/{job_id}", response_model=InsightJobResponse)
+def get_insight_job(
+    job_id: str,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """查询定律生成任务的状态、进度和已生成的定律"""
+    job = db.query(InsightJob).filter(
+        InsightJob.id == job_id,
+        InsightJob.user_id == user.id
+    ).first()
+
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+    return _job_payload(db, job)
+
 
+def _job_payload(db: Session, job: InsightJob) -> Dict:
+    insight_ids = job.insight_ids or []
+    insights_by_id = {
+        insight.id: insight
+        for insight in db.query(JoyInsight).options(undefer(JoyInsight.evidence_cards)).filter(
+            JoyInsight.id.in_(insight_ids)
+        ).all()
+    } if insight_ids else {}
     return {
-        "insights": created_insights,
-        "message": f"成功生成{len(created_insights)}条快乐定律"
+        "id": job.id,
+        "status": job.status.value,
+        "progress": job.progress or 0,
+        "insights": [insights_by_id[i] for i in insight_ids if i in insights_by_id],
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at
     }
 
 
+@router.post("/generate/stream")
+async def generate_insights_stream(
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    流式生成快乐定律（Server-Sent Events），每条定律保存后立即推送
+
+    事件：
+    - insight: 一条定律，结构同 JoyInsightResponse
+    - done: {"count": 定律条数, "message": "..."}
+    - error: {"detail": "..."}
+    """
+    cards = db.query(JoyCard).filter(JoyCard.user_id == user.id).all()
+
+    if len(cards) < 5:
+        raise HTTPException(
+            status_code=400,
+            detail=f"需要至少5张卡片才能生成定律，当前有{len(cards)}张"
+        )
+
+    # 请求级 db 会在响应开始前关闭，推送时用独立的 session 读取定律
+    user_id = user.id
+
+    async def event_stream():
+        count = 0
+        try:
+            async for insight_id in InsightService.astream_for_user(user_id, cards):
+                read_db = SessionLocal()
+                try:
+                    insight = read_db.get(JoyInsight, insight_id, options=[undefer(JoyInsight.evidence_cards)])
+                    payload = JoyInsightResponse.model_validate(insight).model_dump(mode="json") if insight else None
+                finally:
+                    read_db.close()
+                if payload is None:
+                    continue
+                count += 1
+                yield _sse("insight", payload)
+
+            yield _sse("done", {"count": count, "message": f"成功生成{count}条快乐定律"})
+        except Exception as e:
+            print(f"流式生成定律失败: {str(e)}")
+            yield _sse("error", {"detail": f"生成失败: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _sse(event: str, data: Dict) -> str:
+    """格式化一条 SSE 事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
 @router.get("", response_model=list[JoyInsightResponse])
 def get_insights(
+    response: Response,
+    include_evidence: bool = True,
+    limit: Optional[int] = Query(None, ge=1, le=100),
+    cursor: Optional[str] = None,
+    include_total: bool = False,
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """获取定律列表"""
-    insights = db.query(JoyInsight).filter(
-        JoyInsight.user_id == user.id
-    ).order_by(JoyInsight.created_at.desc()).all()
+    """
+    获取定律列表，新的在前；include_evidence=false 时不查询证据（evidence_cards 返回 null）
+
+    不传 limit 时返回全部定律。传入 limit 时分页：下一页游标放在响应头 X-Next-Cursor（没有更多时不返回），
+    翻页时作为 cursor 传回；include_total=true 时总数放在 X-Total-Count。响应体仍是定律数组
+    """
+    columns = _LIST_COLUMNS if include_evidence else tuple(
+        column for column in _LIST_COLUMNS if column.key != "evidence_cards"
+    )
+    query = db.query(*columns).filter(JoyInsight.user_id == user.id)
+    if limit is None:
+        return query.order_by(JoyInsight.created_at.desc(), JoyInsight.id.desc()).all()
 
+    try:
+        insights, next_cursor = keyset_page(query, JoyInsight.created_at, JoyInsight.id, limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if include_total:
+        response.headers["X-Total-Count"] = str(db.query(JoyInsight).filter(JoyInsight.user_id == user.id).count())
     return insights
 
 
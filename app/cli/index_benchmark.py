@@ -0,0 +1,172 @@
+"""
+索引基准：在临时 SQLite 数据库中生成大量数据，对比建索引前后热点查询的执行计划与耗时
+
+用法：
+    python -m app.cli.index_benchmark                 # 默认 100 万张卡片
+    python -m app.cli.index_benchmark --cards 200000 --users 2000
+
+只读写 --db 指定的临时文件（默认 /tmp/joyformula_index_bench.db），不影响应用数据库
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from sqlalchemy import create_engine, func, select, tuple_
+from app.database import Base
+from app.models.user import User
+from app.models.joy_card import JoyCard
+from app.models.joy_insight import JoyInsight
+from app.models.chat_session import ChatSession, SessionStatus
+from app.models import chat_message, insight_generation, insight_job  # noqa: F401  注册全部表
+from app.schemas.joy_card import JoyCardResponse
+from app.schemas.joy_insight import JoyInsightResponse
+
+# 参与对比的索引（其余索引两轮都保留）
+BENCH_INDEXES = ("ix_joy_cards_user_created_id", "ix_joy_insights_user_created_id", "ix_chat_sessions_user_status")
+BATCH_SIZE = 50000
+
+
+def _indexes(engine):
+    return [
+        index for table in Base.metadata.tables.values() for index in table.indexes
+        if index.name in BENCH_INDEXES
+    ]
+
+
+def _populate(engine, cards: int, users: int) -> list:
+    """生成用户、卡片（每张约 300 字原话）、定律（卡片数 1/10）和会话（卡片数 1/2），返回用户 id"""
+    rng = random.Random(42)
+    user_ids = [str(uuid.uuid4()) for _ in range(users)]
+    start = datetime(2024, 1, 1)
+    raw_input = "今天和朋友去公园散步，阳光很好，我们聊了很多。" * 12
+
+    def rows(count, build):
+        batch = []
+        for i in range(count):
+            batch.append(build(i))
+            if len(batch) >= BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {"id": user_id, "user_identifier": f"bench-{i}", "language": "zh", "created_at": start}
+            for i, user_id in enumerate(user_ids)
+        ])
+
+        def card(i):
+            created_at = start + timedelta(seconds=rng.randint(0, 365 * 86400))
+            return {"id": str(uuid.uuid4()), "user_id": rng.choice(user_ids), "raw_input": raw_input,
+                    "formula_scene": "公园", "formula_people": "朋友", "formula_event": "散步",
+                    "formula_trigger": "阳光", "formula_sensation": "放松", "card_summary": "公园散步",
+                    "created_at": created_at, "updated_at": created_at}
+        for batch in rows(cards, card):
+            conn.execute(JoyCard.__table__.insert(), batch)
+
+        def insight(i):
+            created_at = start + timedelta(seconds=rng.randint(0, 365 * 86400))
+            return {"id": str(uuid.uuid4()), "user_id": rng.choice(user_ids), "insight_text": "和朋友分享的小事带来快乐",
+                    "statement": "和朋友分享的小事带来快乐", "keywords": ["朋友", "公园"],
+                    "evidence_cards": [{"card_id": str(uuid.uuid4()), "quote": raw_input[:40]}] * 3,
+                    "is_confirmed": False, "is_rejected": False, "created_at": created_at, "updated_at": created_at}
+        for batch in rows(cards // 10, insight):
+            conn.execute(JoyInsight.__table__.insert(), batch)
+
+        statuses = list(SessionStatus)
+
+        def session(i):
+            return {"id": str(uuid.uuid4()), "user_id": rng.choice(user_ids), "status": rng.choice(statuses),
+                    "message_count": 0, "version": 1,
+                    "created_at": start + timedelta(seconds=rng.randint(0, 365 * 86400))}
+        for batch in rows(cards // 2, session):
+            conn.execute(ChatSession.__table__.insert(), batch)
+    return user_ids
+
+
+def _queries():
+    """与接口实际发出的查询一致：名称 -> 以用户 id 构造语句的函数"""
+    card_columns = [getattr(JoyCard, name) for name in JoyCardResponse.model_fields]
+    insight_columns = [getattr(JoyInsight, name) for name in JoyInsightResponse.model_fields]
+    return {
+        "GET /api/cards (list)": lambda user_id: select(*card_columns).where(
+            JoyCard.user_id == user_id).order_by(JoyCard.created_at.desc(), JoyCard.id.desc()).limit(21),
+        "GET /api/cards (cursor page)": lambda user_id: select(*card_columns).where(
+            JoyCard.user_id == user_id,
+            tuple_(JoyCard.created_at, JoyCard.id) < tuple_(datetime(2024, 7, 1), "")
+        ).order_by(JoyCard.created_at.desc(), JoyCard.id.desc()).limit(21),
+        "GET /api/cards (total)": lambda user_id: select(func.count()).select_from(JoyCard).where(
+            JoyCard.user_id == user_id),
+        "GET /api/insights": lambda user_id: select(*insight_columns).where(
+            JoyInsight.user_id == user_id).order_by(JoyInsight.created_at.desc(), JoyInsight.id.desc()),
+        "active sessions by user": lambda user_id: select(ChatSession.id).where(
+            ChatSession.user_id == user_id, ChatSession.status == SessionStatus.ACTIVE),
+    }
+
+
+def _measure(engine, user_ids: list, runs: int) -> dict:
+    results = {}
+    rng = random.Random(7)
+    with engine.connect() as conn:
+        for name, build in _queries().items():
+            sample = build(user_ids[0]).compile(engine, compile_kwargs={"literal_binds": True})
+            plan = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sample}")]
+            timings = []
+            for _ in range(runs):
+                statement = build(rng.choice(user_ids))
+                started = time.perf_counter()
+                conn.execute(statement).fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = (plan, statistics.median(timings))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare query plans with and without the per-user indexes")
+    parser.add_argument("--cards", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=20, help="每个查询的执行次数（取中位数）")
+    parser.add_argument("--db", default="/tmp/joyformula_index_bench.db")
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    engine = create_engine(f"sqlite:///{args.db}")
+    Base.metadata.create_all(bind=engine)
+    for index in _indexes(engine):
+        index.drop(bind=engine)
+
+    started = time.perf_counter()
+    user_ids = _populate(engine, args.cards, args.users)
+    print(f"生成 {args.cards} 张卡片 / {args.users} 个用户，用时 {time.perf_counter() - started:.1f}s")
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql("ANALYZE")
+    before = _measure(engine, user_ids, args.runs)
+
+    started = time.perf_counter()
+    for index in _indexes(engine):
+        index.create(bind=engine)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("ANALYZE")
+    print(f"创建索引用时 {time.perf_counter() - started:.1f}s")
+    after = _measure(engine, user_ids, args.runs)
+
+    for name in before:
+        print(f"\n== {name}")
+        for label, (plan, median_ms) in (("before", before[name]), ("after", after[name])):
+            print(f"  {label:<6} {median_ms:9.2f} ms  | " + "; ".join(plan))
+
+    engine.dispose()
+    os.remove(args.db)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,9 +11,11 @@ from app.models.joy_card import JoyCard
 from app.models.joy_insight import JoyInsight
 from app.models.chat_session import ChatSession, SessionStatus, SessionType
 from app.services.chat_service import ChatService
+from app.services.chat_history import ChatHistoryService
 from app.services.insight_service import InsightService
 from app.services.exploration_service import ExplorationService
 from app.i18n import t, set_language, get_language
+from sqlalchemy.orm import undefer
 from rich.console import Console
 from rich.panel import Panel
 from rich.prompt import Prompt, IntPrompt
@@ -125,17 +127,15 @@ class JoyFormulaCLI:
         console.print(f"\n{t('chat_start_title')}")
         console.print(t("chat_hint"))
 
-        # 创建会话
+        # 创建会话，开场白与会话一起写入
+        initial = ChatService.start_conversation()
         session = ChatSession(
             user_id=self.user.id,
             session_type=SessionType.CARD_CREATION
         )
         self.db.add(session)
-        self.db.commit()
-
-        # 初始消息
-        initial = ChatService.start_conversation()
-        session.messages = [{"role": "assistant", "content": initial["initial_message"]}]
+        messages = [{"role": "assistant", "content": initial["initial_message"]}]
+        ChatHistoryService.append(self.db, session, messages)
         self.db.commit()
 
         console.print(f"{t('chat_joy_coach')} {initial['initial_message']}\n")
@@ -154,11 +154,7 @@ class JoyFormulaCLI:
 
             if user_input.lower() in ['完成', 'done']:
                 if draft_card:
-                    # 最终更新 raw_input 和 conversation_history
-                    draft_card.raw_input = "\n".join(
-                        msg["content"] for msg in session.messages if msg["role"] == "user"
-                    )
-                    draft_card.conversation_history = session.messages
+                    # raw_input 每轮已追加，对话历史由卡片的 session_id 引用
                     session.status = SessionStatus.COMPLETED
                     self.db.commit()
                     console.print("\n" + "="*50)
@@ -174,16 +170,25 @@ class JoyFormulaCLI:
 
             # 语音输入处理
             if user_input.startswith("/voice"):
-                voice_result = self._handle_voice_input(user_input, session)
+                voice_result = self._handle_voice_input(user_input, messages)
                 if voice_result is None:
                     continue
                 result = voice_result
             else:
                 # 处理文本消息
-                result = ChatService.process_message(session.messages, user_input)
-
-            # 更新会话
-            session.messages = result["updated_history"]
+                result = ChatService.process_message(messages, user_input, session.summary)
+
+            # 更新会话：只追加本轮新增的消息
+            new_messages = result["updated_history"][len(messages):]
+            ChatHistoryService.append(self.db, session, new_messages)
+            messages = result["updated_history"]
+            if draft_card is not None:
+                # 草稿已存在时，本轮的用户发言追加到卡片原话末尾
+                draft_card.raw_input = "\n".join(
+                    [draft_card.raw_input] + [msg["content"] for msg in new_messages if msg["role"] == "user"]
+                )
+            if "summary" in result:
+                session.summary = result["summary"]
 
             # 显示回复
             console.print(f"\n{t('chat_joy_coach')} {result['assistant_reply']}\n")
@@ -191,33 +196,28 @@ class JoyFormulaCLI:
             # 如果检测到公式，创建/更新草稿卡片
             if result["is_complete"]:
                 formula = result["formula"]["formula"]
-                all_user_inputs = "\n".join(
-                    msg["content"] for msg in session.messages if msg["role"] == "user"
-                )
 
                 if draft_card is None:
                     draft_card = JoyCard(
                         user_id=self.user.id,
-                        raw_input=all_user_inputs,
+                        session_id=session.id,
+                        raw_input="\n".join(msg["content"] for msg in messages if msg["role"] == "user"),
                         formula_scene=formula.get("scene"),
                         formula_people=formula.get("people"),
                         formula_event=formula.get("event"),
                         formula_trigger=formula.get("trigger"),
                         formula_sensation=formula.get("sensation"),
-                        card_summary=result["formula"]["card_summary"],
-                        conversation_history=session.messages
+                        card_summary=result["formula"]["card_summary"]
                     )
                     self.db.add(draft_card)
                     session.joy_card_id = draft_card.id
                 else:
-                    draft_card.raw_input = all_user_inputs
                     draft_card.formula_scene = formula.get("scene")
                     draft_card.formula_people = formula.get("people")
                     draft_card.formula_event = formula.get("event")
                     draft_card.formula_trigger = formula.get("trigger")
                     draft_card.formula_sensation = formula.get("sensation")
                     draft_card.card_summary = result["formula"]["card_summary"]
-                    draft_card.conversation_history = session.messages
 
                 self.db.commit()
 
@@ -233,7 +233,7 @@ class JoyFormulaCLI:
 
         Prompt.ask(t("press_enter_return"))
 
-    def _handle_voice_input(self, user_input: str, session):
+    def _handle_voice_input(self, user_input: str, messages):
         """处理 /voice 命令，返回处理结果或 None（失败时）"""
         from app.config import settings
 
@@ -275,7 +275,7 @@ class JoyFormulaCLI:
             audio_bytes = f.read()
 
         result = ChatService.process_voice_message(
-            session.messages, audio_bytes, mime_type
+            messages, audio_bytes, mime_type
         )
 
         # 显示转录结果
@@ -374,7 +374,7 @@ class JoyFormulaCLI:
 
     def view_insights(self):
         """查看快乐定律"""
-        insights = self.db.query(JoyInsight).filter(
+        insights = self.db.query(JoyInsight).options(undefer(JoyInsight.evidence_cards)).filter(
             JoyInsight.user_id == self.user.id
         ).order_by(JoyInsight.created_at.desc()).all()
 
@@ -505,7 +505,7 @@ class JoyFormulaCLI:
     def switch_ai_provider(self):
         """切换AI提供商"""
         from app.config import settings
-        from app.services.ai_service import ai_service
+        from app.services.ai_router import ai_service
 
         console.print(t("current_provider"), settings.AI_PROVIDER)
         console.print(t("available_options"))
@@ -525,7 +525,7 @@ class JoyFormulaCLI:
 
         new_provider = provider_map[choice]
         settings.AI_PROVIDER = new_provider
-        ai_service.__init__(new_provider)
+        ai_service.__init__([new_provider])
 
         console.print(t("provider_switched", provider=new_provider))
         Prompt.ask(t("press_enter_return"))
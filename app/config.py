@@ -5,9 +5,40 @@ from typing import Literal
 class Settings(BaseSettings):
     # 数据库
     DATABASE_URL: str = "sqlite:///./joyformula.db"
+    # 连接池：常驻连接数、高峰时额外连接数、取连接的最长等待秒数
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0
 
     # AI 提供商配置
-    AI_PROVIDER: Literal["anthropic", "openai", "gemini", "custom"] = "anthropic"
+    AI_PROVIDER: Literal["anthropic", "openai", "gemini", "custom", "stub"] = "anthropic"
+
+    # 提供商故障转移链（逗号分隔，如 "anthropic,openai,gemini"），为空时只用 AI_PROVIDER
+    AI_PROVIDERS: str = ""
+    # 错误率 EWMA 超过该阈值的提供商排到链尾
+    AI_PROVIDER_ERROR_THRESHOLD: float = 0.5
+    # 最后一次失败后超过该秒数，提供商重新按正常顺序参与路由
+    AI_PROVIDER_RECOVERY_SECONDS: int = 30
+    AI_EWMA_ALPHA: float = 0.2
+    # 健康的提供商按 EWMA 延迟排序（否则按配置顺序）
+    AI_ROUTE_BY_LATENCY: bool = False
+    # 对冲请求：对话请求超过当前提供商 p95（样本不足时用默认值）仍未返回，并发请求下一个提供商
+    AI_HEDGE_ENABLED: bool = False
+    AI_HEDGE_DELAY_SECONDS: float = 8.0
+    AI_HEDGE_MIN_DELAY_SECONDS: float = 2.0
+    # 每个提供商的请求/令牌速率上限（每分钟，0 为不限制），按本地估算的 token 数计费
+    AI_RPM_LIMIT: int = 0
+    AI_TPM_LIMIT: int = 0
+    # 按提供商覆盖速率上限，格式 "provider:rpm:tpm"，逗号分隔，如 "anthropic:50:40000,openai:500:200000"
+    AI_RATE_LIMITS: str = ""
+    # 暂时性错误（429/5xx/连接超时）在同一提供商内的最多尝试次数（含首次），指数退避 + 抖动
+    AI_RETRY_MAX_ATTEMPTS: int = 3
+    AI_RETRY_BASE_DELAY_SECONDS: float = 0.5
+    # 单次退避上限；提供商要求的 Retry-After 超过该值时不再等待，直接故障转移
+    AI_RETRY_MAX_DELAY_SECONDS: float = 8.0
+    # 熔断：连续暂时性错误达到阈值后停止请求该提供商，N 秒后放行一个探测请求
+    AI_BREAKER_FAILURE_THRESHOLD: int = 5
+    AI_BREAKER_OPEN_SECONDS: float = 30.0
 
     # API Keys
     ANTHROPIC_API_KEY: str = ""
@@ -17,6 +48,61 @@ class Settings(BaseSettings):
     # 自定义 AI 端点（用于 Defy 或其他）
     CUSTOM_AI_ENDPOINT: str = ""
     CUSTOM_AI_API_KEY: str = ""
+    CUSTOM_AI_CONNECT_TIMEOUT: float = 5.0
+    CUSTOM_AI_READ_TIMEOUT: float = 120.0        # 两次读取间的最长等待（流式时为相邻分片的间隔）
+    CUSTOM_AI_MAX_CONNECTIONS: int = 100
+    CUSTOM_AI_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    CUSTOM_AI_KEEPALIVE_EXPIRY: float = 30.0
+    CUSTOM_AI_HTTP2: bool = True                 # 需要安装 h2，未安装时使用 HTTP/1.1
+    CUSTOM_AI_GZIP_REQUESTS: bool = False        # 请求体 gzip 压缩（端点需支持 Content-Encoding: gzip）
+    CUSTOM_AI_STREAM: bool = False               # 端点支持 SSE 流式输出（请求带 "stream": true）
+
+    # 本地 stub 提供商（AI_PROVIDER=stub，离线压测用）
+    STUB_SEED: int = 0
+    STUB_FORMULA_AFTER_TURNS: int = 3            # 第 N 条用户消息后输出公式 JSON
+    STUB_LATENCY_DISTRIBUTION: Literal["fixed", "uniform", "lognormal"] = "fixed"
+    STUB_LATENCY_MS: float = 0                   # fixed/uniform 为均值，lognormal 为中位数
+    STUB_LATENCY_SPREAD: float = 0.5             # uniform 为相对幅度，lognormal 为对数标准差
+    STUB_ERROR_RATE: float = 0.0                 # 注入 429/500/503 错误的概率
+    STUB_STREAM_CHUNK_CHARS: int = 8
+    STUB_STREAM_CHUNK_DELAY_MS: float = 20
+
+    # 结构化输出：Anthropic 工具调用 / OpenAI json_schema / Gemini response_schema 约束回复格式
+    # 关闭后所有提供商回到纯文本 + 正则解析
+    STRUCTURED_OUTPUT_ENABLED: bool = True
+
+    # 提示词前缀缓存（Anthropic cache_control / Gemini CachedContent）
+    PROMPT_CACHE_ENABLED: bool = True
+    GEMINI_CACHE_TTL_SECONDS: int = 3600
+
+    # Gemini 模型实例 LRU 容量（按 模型+系统提示词+语言 复用）
+    GEMINI_MODEL_CACHE_SIZE: int = 32
+
+    # 对话历史 token 预算（本地估算）：超出时最近 N 轮之前的消息以滚动摘要代替
+    CHAT_HISTORY_TOKEN_BUDGET: int = 6000
+    CHAT_HISTORY_KEEP_TURNS: int = 6
+
+    # 快乐盲盒推荐缓存（秒）：新鲜期内直接返回，过期窗口内返回旧结果并后台刷新
+    RECOMMENDATION_CACHE_TTL_SECONDS: int = 600
+    RECOMMENDATION_CACHE_STALE_SECONDS: int = 86400
+    RECOMMENDATION_CACHE_SIZE: int = 1024
+
+    # 快乐定律生成结果记忆（卡片集合未变化时直接复用）
+    INSIGHT_MEMO_TTL_SECONDS: int = 86400
+    INSIGHT_MEMO_SIZE: int = 1024
+    # 增量生成：已有定律时只发送上次生成后新增/修改的卡片，让 AI 细化、合并或补充已有定律
+    INSIGHT_INCREMENTAL_ENABLED: bool = True
+    # 卡片超过该 token 预算时按预算分片，并发提取候选模式后再归并（map-reduce）
+    INSIGHT_CHUNK_TOKEN_BUDGET: int = 8000
+    INSIGHT_MAP_CONCURRENCY: int = 4
+    # 后台定律生成任务：worker 数、空闲轮询间隔、执行中任务多久未更新视为中断（重新排队）、最多尝试次数
+    INSIGHT_JOB_WORKERS: int = 2
+    INSIGHT_JOB_POLL_SECONDS: float = 5.0
+    INSIGHT_JOB_STALE_SECONDS: int = 600
+    INSIGHT_JOB_MAX_ATTEMPTS: int = 3
+
+    # 提示词中每张卡片 raw_input 的 token 上限（去掉与卡片摘要重复的发言后截断）
+    PROMPT_RAW_INPUT_TOKEN_BUDGET: int = 120
 
     # 简化认证（Hackathon 阶段）
     SIMPLE_AUTH: bool = True
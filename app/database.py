@@ -1,4 +1,6 @@
+import json
 import os
+import uuid
 from sqlalchemy import create_engine, text, inspect
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
@@ -12,9 +14,19 @@ if os.environ.get("VERCEL") and db_url.startswith("sqlite"):
     # 将数据库指向唯一的权限可写目录 /tmp
     db_url = "sqlite:////tmp/joyformula.db"
 
+engine_options = {}
+if ":memory:" not in db_url:
+    # 请求只在读写数据时短暂持有连接（AI 调用期间归还），连接池按并发请求数配置
+    engine_options.update(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT
+    )
+
 engine = create_engine(
     db_url,
-    connect_args={"check_same_thread": False} if "sqlite" in db_url else {}
+    connect_args={"check_same_thread": False} if "sqlite" in db_url else {},
+    **engine_options
 )
 # --- 修改结束 ---
 
@@ -32,7 +44,7 @@ def init_db():
     """初始化数据库"""
     # 如果是 Vercel 生产环境，SQLite 的改动是无法持久化的
     # 但为了让程序不报错崩溃，我们依然允许它在 /tmp 下执行
-    from app.models import user, joy_card, joy_insight, chat_session
+    from app.models import user, joy_card, joy_insight, chat_session, chat_message, insight_generation, insight_job
     
     try:
         Base.metadata.create_all(bind=engine)
@@ -55,5 +67,72 @@ def init_db():
                     if "keywords" not in insight_columns:
                         conn.execute(text("ALTER TABLE joy_insights ADD COLUMN keywords JSON"))
                     conn.commit()
+
+            if "chat_sessions" in insp.get_table_names():
+                session_columns = [c["name"] for c in insp.get_columns("chat_sessions")]
+                with engine.connect() as conn:
+                    if "history_summary" not in session_columns:
+                        conn.execute(text("ALTER TABLE chat_sessions ADD COLUMN history_summary TEXT"))
+                    if "summary_message_count" not in session_columns:
+                        conn.execute(text("ALTER TABLE chat_sessions ADD COLUMN summary_message_count INTEGER DEFAULT 0"))
+                    if "version" not in session_columns:
+                        conn.execute(text("ALTER TABLE chat_sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+                    if "message_count" not in session_columns:
+                        conn.execute(text("ALTER TABLE chat_sessions ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0"))
+                    conn.commit()
+                if "messages" in session_columns:
+                    _migrate_chat_messages()
+
+            if "joy_cards" in insp.get_table_names():
+                card_columns = [c["name"] for c in insp.get_columns("joy_cards")]
+                if "session_id" not in card_columns:
+                    with engine.connect() as conn:
+                        conn.execute(text("ALTER TABLE joy_cards ADD COLUMN session_id VARCHAR"))
+                        conn.commit()
+                    _link_cards_to_sessions()
+
+        # create_all 只为新建的表创建索引，已有表上后来声明的索引在这里补建
+        for table in Base.metadata.tables.values():
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
     except Exception as e:
-        print(f"Database init skipped or failed: {e}")
\ No newline at end of file
+        print(f"Database init skipped or failed: {e}")
+
+
+def _migrate_chat_messages():
+    """旧版会话的消息存在 chat_sessions.messages（JSON），逐条迁移到 chat_messages 后清空原列"""
+    with engine.begin() as conn:
+        rows = conn.execute(text(
+            "SELECT id, messages, created_at FROM chat_sessions "
+            "WHERE messages IS NOT NULL AND message_count = 0"
+        )).fetchall()
+        for session_id, raw_messages, created_at in rows:
+            messages = json.loads(raw_messages) if isinstance(raw_messages, str) else (raw_messages or [])
+            if messages:
+                conn.execute(
+                    text("INSERT INTO chat_messages (id, session_id, seq, role, content, created_at) "
+                         "VALUES (:id, :session_id, :seq, :role, :content, :created_at)"),
+                    [{"id": str(uuid.uuid4()), "session_id": session_id, "seq": seq,
+                      "role": msg["role"], "content": msg["content"], "created_at": created_at}
+                     for seq, msg in enumerate(messages)]
+                )
+            conn.execute(
+                text("UPDATE chat_sessions SET message_count = :count, messages = NULL WHERE id = :id"),
+                {"count": len(messages), "id": session_id}
+            )
+        if rows:
+            print(f"已将 {len(rows)} 个会话的消息迁移到 chat_messages")
+
+
+def _link_cards_to_sessions():
+    """旧版卡片通过 chat_sessions.joy_card_id 关联回会话；会话消息已在 chat_messages 中的，清除卡片上的 JSON 副本"""
+    with engine.begin() as conn:
+        conn.execute(text(
+            "UPDATE joy_cards SET session_id = ("
+            "SELECT chat_sessions.id FROM chat_sessions WHERE chat_sessions.joy_card_id = joy_cards.id LIMIT 1"
+            ") WHERE session_id IS NULL"
+        ))
+        conn.execute(text(
+            "UPDATE joy_cards SET conversation_history = NULL WHERE session_id IS NOT NULL "
+            "AND EXISTS (SELECT 1 FROM chat_messages WHERE chat_messages.session_id = joy_cards.session_id)"
+        ))
@@ -1,15 +1,21 @@
-"""全局语言状态"""
+"""
+当前语言状态
+
+保存在 ContextVar 中：每个请求 / asyncio 任务各自一份，互不影响。
+新建任务（create_task）和 to_thread / 线程池调用会复制创建时的上下文；
+但线程池中设置的值不会传回调用方，因此请求语言需在请求自身的异步上下文中设置（见 api.auth.get_current_user）。
+"""
+from contextvars import ContextVar, Token
 
 # 支持: "zh", "en"
-current_language: str = "en"
+_current_language: ContextVar[str] = ContextVar("current_language", default="en")
 
 
-def set_language(lang: str) -> None:
-    global current_language
+def set_language(lang: str) -> Token:
     if lang not in ("zh", "en"):
         raise ValueError(f"Unsupported language: {lang}")
-    current_language = lang
+    return _current_language.set(lang)
 
 
 def get_language() -> str:
-    return current_language
+    return _current_language.get()
@@ -839,6 +839,33 @@ CHAT_INITIAL_MESSAGE = {
     "en": "Hey! Was there anything that made you happy today? Feel free to share with me 😊",
 }
 
+HISTORY_SUMMARY_SYSTEM_PROMPT = {
+    "zh": """你负责压缩 Joy Coach 与用户的对话记录，供后续对话继续使用。
+
+请把已有摘要和新增的对话合并成一份新的摘要：
+- 保留用户分享的快乐瞬间的所有具体细节：场景、人物、事情、诱因、感官/感受
+- 保留用户的原话中有代表性的表达、情绪和 Joy Coach 已经追问过的问题
+- 如果已经生成过快乐公式，写明各要素的当前取值
+- 只输出摘要正文，不要寒暄，不要输出 JSON 代码块""",
+    "en": """You compress the conversation between Joy Coach and the user so the chat can continue.
+
+Merge the existing summary and the new turns into one updated summary:
+- Keep every concrete detail of the happy moment: scene, people, event, trigger, sensation/feeling
+- Keep representative wording and emotions from the user, and the questions Joy Coach has already asked
+- If a joy formula has already been produced, state the current value of each element
+- Output only the summary text, no pleasantries, no JSON code blocks""",
+}
+
+HISTORY_SUMMARY_REQUEST = {
+    "zh": "已有摘要：\n{summary}\n\n新增对话：\n{transcript}",
+    "en": "Existing summary:\n{summary}\n\nNew turns:\n{transcript}",
+}
+
+HISTORY_SUMMARY_PREFIX = {
+    "zh": "（以下是我们之前对话的摘要，请在此基础上继续）\n{summary}",
+    "en": "(Summary of our earlier conversation, please continue from here)\n{summary}",
+}
+
 INSIGHT_SYSTEM_PROMPT = {
     "zh": "你是一位专业的心理学专家，擅长从数据中发现人类行为模式。",
     "en": "You are a professional psychology expert skilled at discovering human behavioral patterns from data.",
@@ -848,7 +875,8 @@ INSIGHT_GENERATION_PROMPT = {
     "zh": """分析以下用户的快乐卡片，识别其中的模式和规律，生成"快乐定律"。
 
 ## 卡片数据
-{cards_json}
+（每行一张卡片，字段以 | 分隔，首行为字段名；raw_input 为用户原话节选）
+{cards_table}
 
 ## 分析要求
 1. 识别重复出现的场景、人物、事件类型
@@ -883,10 +911,11 @@ INSIGHT_GENERATION_PROMPT = {
     Analyze the following user's joy cards, identify patterns and regularities, and generate 1-2 Joy Theorems. If generating 2 theorems, ensure they capture different dimensions of the user's joy (e.g., one about social patterns, one about sensory patterns; or one about solitude, one about connection).
 You are "Joy", analyzing user happiness patterns to generate "Joy Theorems" - deep insights about what brings them joy.
 ## Card Data
-{cards_json}
+(One card per line, fields separated by |, first line is the header; raw_input is an excerpt of the user's own words)
+{cards_table}
 
 ## Input
-User's joy cards in JSON format with fields: scene, people, event, trigger, sensation, raw_input etc.
+User's joy cards as a table with fields: id, summary, raw_input, scene, people, event, trigger, sensation.
 
 ## Output Format (STRICT)
 
@@ -1076,6 +1105,212 @@ Find elements that appear in **3+ cards** - that's your pattern.
 - All output must be in English""",
 }
 
+INSIGHT_INCREMENTAL_PROMPT = {
+    "zh": """以下是用户已有的快乐定律和上次分析之后新增的快乐卡片。请在已有定律的基础上增量更新，不要重新发现已有的规律。
+
+## 已有定律
+每行格式：id | 状态 | 定律陈述 | 关键词 | 证据卡片数
+{insights_table}
+
+## 新增卡片
+（每行一张卡片，字段以 | 分隔，首行为字段名；raw_input 为用户原话节选）
+{cards_table}
+
+## 要求
+1. 新卡片印证或细化了某条已有定律：输出该定律的更新版本并带上它的 "id"，evidence 只列出新卡片中的证据
+2. 几条已有定律其实是同一个模式：合并为一条，"id" 填保留的那条，"merged_ids" 填被合并掉的其余定律 id
+3. 新卡片中出现了已有定律没有覆盖的模式：输出新定律（不带 "id"）
+4. 不需要改动的定律不要输出；状态为 confirmed 的定律只能细化，不能被合并掉
+
+## 输出格式
+用```json包裹：
+
+```json
+{{
+  "insights": [
+    {{
+      "id": "已有定律的 id（新定律省略此字段）",
+      "merged_ids": ["被合并的定律 id"],
+      "insight": "快乐定律的核心洞察(1-2句话，要有洞察力)",
+      "statement": "定律陈述，用一句话概括这个快乐模式",
+      "keywords": ["关键词1", "关键词2", "关键词3"],
+      "evidence": [
+        {{"card_id": "卡片ID", "quote": "用户原话摘录"}}
+      ],
+      "pattern_type": "模式类型标签"
+    }}
+  ]
+}}
+```""",
+
+    "en": """Below are the user's existing Joy Theorems and the joy cards added since the last analysis. Update the theorems incrementally - do not rediscover patterns that are already covered.
+
+## Existing Theorems
+One per line: id | status | statement | keywords | evidence card count
+{insights_table}
+
+## New Cards
+(One card per line, fields separated by |, first line is the header; raw_input is an excerpt of the user's own words)
+{cards_table}
+
+## Rules
+1. A new card supports or sharpens an existing theorem: output the updated theorem with its "id"; list only evidence from the new cards
+2. Several existing theorems describe the same pattern: merge them into one, put the kept theorem in "id" and the others in "merged_ids"
+3. The new cards show a pattern no existing theorem covers: output a new theorem (without "id")
+4. Do not output theorems that need no change; theorems with status confirmed may be refined but never merged away
+5. Quotes must come from the cards' `raw_input`; all output must be in English
+
+## Output Format
+Wrap in ```json:
+
+```json
+{{
+  "insights": [
+    {{
+      "id": "existing theorem id (omit for new theorems)",
+      "merged_ids": ["ids of merged theorems"],
+      "insight": "Specific pattern observation with data support (1-2 sentences)",
+      "statement": "Concise joy rule with key details (10-15 words ideal)",
+      "keywords": ["keyword1", "keyword2", "keyword3"],
+      "evidence": [
+        {{"card_id": "card id", "quote": "brief excerpt from card's raw_input"}}
+      ],
+      "pattern_type": "Category label"
+    }}
+  ]
+}}
+```""",
+}
+
+INSIGHT_MAP_SYSTEM_PROMPT = {
+    "zh": "你是一位专业的心理学专家，负责从一批快乐卡片中提取候选的快乐模式，供后续汇总。",
+    "en": "You are a professional psychology expert extracting candidate joy patterns from one batch of joy cards for a later merge step.",
+}
+
+INSIGHT_MAP_PROMPT = {
+    "zh": """以下是用户快乐卡片中的一批（不是全部）。找出这批卡片中反复出现的快乐模式候选，每个候选至少有 2 张卡片支持。结果会与其他批次的候选合并，所以请保留每个候选的全部证据。
+
+## 卡片数据
+（每行一张卡片，字段以 | 分隔，首行为字段名；raw_input 为用户原话节选）
+{cards_table}
+
+## 输出格式
+用```json包裹：
+
+```json
+{{
+  "patterns": [
+    {{
+      "statement": "一句话概括这个快乐模式",
+      "keywords": ["关键词1", "关键词2", "关键词3"],
+      "pattern_type": "模式类型标签",
+      "evidence": [
+        {{"card_id": "卡片ID", "quote": "用户原话摘录"}}
+      ]
+    }}
+  ]
+}}
+```""",
+
+    "en": """Below is one batch (not all) of the user's joy cards. Find candidate joy patterns that recur within this batch, each supported by at least 2 cards. The candidates will be merged with those from other batches, so keep all evidence for each one.
+
+## Card Data
+(One card per line, fields separated by |, first line is the header; raw_input is an excerpt of the user's own words)
+{cards_table}
+
+## Output Format
+Wrap in ```json:
+
+```json
+{{
+  "patterns": [
+    {{
+      "statement": "One-sentence summary of the joy pattern",
+      "keywords": ["keyword1", "keyword2", "keyword3"],
+      "pattern_type": "Category label",
+      "evidence": [
+        {{"card_id": "card id", "quote": "brief excerpt from card's raw_input"}}
+      ]
+    }}
+  ]
+}}
+```""",
+}
+
+INSIGHT_REDUCE_PROMPT = {
+    "zh": """以下是从用户快乐卡片的各个批次中提取出的候选模式，每个候选附带支持它的卡片和原话。请把它们归并成最终的快乐定律。
+
+## 已有定律
+每行格式：id | 状态 | 定律陈述 | 关键词 | 证据卡片数
+{insights_table}
+
+## 候选模式
+{candidates_json}
+
+## 要求
+1. 不同批次中描述同一模式的候选合并为一条，证据合并；只保留至少有 3 张卡片支持的模式
+2. 识别用户快乐的深层需求(如：表达欲、掌控感、亲密感、创造力、探索欲)，用简洁、有洞察力的语言总结
+3. 候选印证或细化了某条已有定律：输出该定律的更新版本并带上它的 "id"；几条已有定律是同一模式时，"merged_ids" 填被合并掉的定律 id（已有定律为"-"时忽略本条）
+4. evidence 只能使用候选中给出的 card_id 和原话
+
+## 输出格式
+用```json包裹：
+
+```json
+{{
+  "insights": [
+    {{
+      "id": "已有定律的 id（新定律省略此字段）",
+      "merged_ids": ["被合并的定律 id"],
+      "insight": "快乐定律的核心洞察(1-2句话，要有洞察力)",
+      "statement": "定律陈述，用一句话概括这个快乐模式",
+      "keywords": ["关键词1", "关键词2", "关键词3"],
+      "evidence": [
+        {{"card_id": "卡片ID", "quote": "用户原话摘录"}}
+      ],
+      "pattern_type": "模式类型标签"
+    }}
+  ]
+}}
+```""",
+
+    "en": """Below are candidate joy patterns extracted from batches of the user's joy cards, each with the cards and quotes that support it. Merge them into the final Joy Theorems.
+
+## Existing Theorems
+One per line: id | status | statement | keywords | evidence card count
+{insights_table}
+
+## Candidate Patterns
+{candidates_json}
+
+## Rules
+1. Merge candidates from different batches that describe the same pattern, combining their evidence; keep only patterns supported by 3+ cards
+2. Each insight must be non-obvious and reveal something surprising; statement 10-15 words; keywords single words or 2-3 word phrases
+3. A candidate supports or sharpens an existing theorem: output the updated theorem with its "id"; if several existing theorems are the same pattern, list the merged ones in "merged_ids" (ignore this rule when existing theorems are "-")
+4. Evidence may only use card ids and quotes given in the candidates; all output must be in English
+
+## Output Format
+Wrap in ```json:
+
+```json
+{{
+  "insights": [
+    {{
+      "id": "existing theorem id (omit for new theorems)",
+      "merged_ids": ["ids of merged theorems"],
+      "insight": "Specific pattern observation with data support (1-2 sentences)",
+      "statement": "Concise joy rule with key details (10-15 words ideal)",
+      "keywords": ["keyword1", "keyword2", "keyword3"],
+      "evidence": [
+        {{"card_id": "card id", "quote": "brief excerpt from card's raw_input"}}
+      ],
+      "pattern_type": "Category label"
+    }}
+  ]
+}}
+```""",
+}
+
 EXPLORATION_SYSTEM_PROMPT = {
     "zh": "你是一位生活教练，擅长根据人的状态给出实用的建议。",
     "en": "You are a life coach skilled at giving practical advice based on a person's current state.",
@@ -1084,11 +1319,11 @@ EXPLORATION_SYSTEM_PROMPT = {
 EXPLORATION_PROMPT = {
     "zh": """用户当前能量值：{energy_level} / 10
 
-用户的快乐定律：
-{insights_json}
+用户的快乐定律（每行一条，字段以 | 分隔，首行为字段名）：
+{insights_table}
 
-用户的历史快乐卡片（最近5条）：
-{cards_json}
+用户的历史快乐卡片（最近5条，格式同上）：
+{cards_table}
 
 根据用户当前状态和历史规律，推荐3个可执行的快乐探索行动。
 
@@ -1116,11 +1351,11 @@ EXPLORATION_PROMPT = {
 
     "en": """User's current energy level: {energy_level} / 10
 
-User's Joy Laws:
-{insights_json}
+User's Joy Laws (one per line, fields separated by |, first line is the header):
+{insights_table}
 
-User's recent joy cards (last 5):
-{cards_json}
+User's recent joy cards (last 5, same format):
+{cards_table}
 
 Based on the user's current state and historical patterns, recommend 3 actionable happiness exploration activities.
 
@@ -1,15 +1,33 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+import math
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.database import init_db
 from app.api import auth, chat, cards, insights, exploration
+from app.services.ai_router import ai_service
+from app.services.ai_retry import CircuitOpenError
+from app.services.prompt_format import prompt_stats
+from app.services.insight_job_service import InsightJobService
 
 # 初始化数据库
 init_db()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 后台定律生成任务的 worker 池
+    InsightJobService.start_workers()
+    yield
+    await InsightJobService.stop_workers()
+    await ai_service.aclose()
+
+
 app = FastAPI(
     title="JoyFormula API",
     description="基于AI的快乐心理健康产品后端",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS配置
@@ -26,8 +44,20 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 定律列表分页的游标和总数放在响应头中
+    expose_headers=["X-Next-Cursor", "X-Total-Count"],
 )
 
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request: Request, exc: CircuitOpenError):
+    # 所有提供商都已熔断：立即返回 503，不占用 worker 等待注定失败的请求
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "AI 服务暂时不可用，请稍后再试"},
+        headers={"Retry-After": str(max(math.ceil(exc.retry_after), 1))}
+    )
+
+
 # 注册路由
 app.include_router(auth.router)
 app.include_router(chat.router)
@@ -47,4 +77,13 @@ def root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy"}
+    providers = ai_service.get_provider_stats()
+    # 有提供商处于熔断/半开状态时标记为 degraded
+    degraded = any(stats["circuit"]["state"] != "closed" for stats in providers.values())
+    return {
+        "status": "degraded" if degraded else "healthy",
+        "prompt_cache": ai_service.get_cache_stats(),
+        "providers": providers,
+        "scheduler": ai_service.get_scheduler_stats(),
+        "prompts": prompt_stats.snapshot()
+    }
@@ -0,0 +1,28 @@
+from sqlalchemy import Column, String, Text, Integer, DateTime, ForeignKey, Index
+from sqlalchemy.orm import relationship
+from datetime import datetime
+import uuid
+from app.database import Base
+
+
+class ChatMessage(Base):
+    """会话中的一条消息：只追加不修改，按 (session_id, seq) 顺序读取"""
+    __tablename__ = "chat_messages"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    session_id = Column(String, ForeignKey("chat_sessions.id"), nullable=False)
+    seq = Column(Integer, nullable=False)  # 会话内从 0 开始的序号
+    role = Column(String, nullable=False)  # "user" | "assistant"
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # 关系
+    session = relationship("ChatSession", back_populates="chat_messages")
+
+    __table_args__ = (
+        # 历史读取是一次按序号的范围查询；唯一约束同时防止并发追加写出重复序号
+        Index("ix_chat_messages_session_seq", "session_id", "seq", unique=True),
+    )
+
+    def to_dict(self):
+        return {"role": self.role, "content": self.content}
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, JSON, Enum
+from sqlalchemy import Column, String, Text, Integer, DateTime, ForeignKey, Enum, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -27,11 +27,39 @@ class ChatSession(Base):
     session_type = Column(Enum(SessionType), default=SessionType.CARD_CREATION)
     status = Column(Enum(SessionStatus), default=SessionStatus.ACTIVE)
 
-    # 消息历史
-    messages = Column(JSON, default=list)  # [{"role": "user"/"assistant", "content": "..."}]
+    # 消息历史逐条存放在 chat_messages 表（见 ChatHistoryService），这里只记录条数，即下一条消息的序号
+    message_count = Column(Integer, nullable=False, default=0)
+
+    # 滚动摘要：历史超出 token 预算时，前 summary_message_count 条消息以摘要代替发送给 AI
+    history_summary = Column(Text, nullable=True)
+    summary_message_count = Column(Integer, default=0)
+
+    # 乐观锁版本号：每次 UPDATE 自增，提交时版本不符（期间被其他请求修改）抛出 StaleDataError
+    version = Column(Integer, nullable=False, default=1)
 
     created_at = Column(DateTime, default=datetime.utcnow)
     completed_at = Column(DateTime, nullable=True)
 
     # 关系
     user = relationship("User", back_populates="chat_sessions")
+    chat_messages = relationship("ChatMessage", back_populates="session", cascade="all, delete-orphan",
+                                 order_by="ChatMessage.seq")
+
+    __table_args__ = (
+        # 按用户查找会话及其状态（单个会话按主键 id 查找，无需额外索引）
+        Index("ix_chat_sessions_user_status", "user_id", "status"),
+    )
+
+    __mapper_args__ = {"version_id_col": version}
+
+    @property
+    def summary(self):
+        """滚动摘要（供 ChatService 使用），没有摘要时为 None"""
+        if not self.history_summary:
+            return None
+        return {"text": self.history_summary, "message_count": self.summary_message_count or 0}
+
+    @summary.setter
+    def summary(self, value):
+        self.history_summary = value["text"] if value else None
+        self.summary_message_count = value["message_count"] if value else 0
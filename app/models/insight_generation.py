@@ -0,0 +1,23 @@
+from sqlalchemy import Column, String, DateTime, ForeignKey, JSON
+from sqlalchemy.orm import relationship
+from datetime import datetime
+import uuid
+from app.database import Base
+
+
+class InsightGeneration(Base):
+    """一次定律生成的记录：覆盖了哪些卡片、产出/更新了哪些定律"""
+    __tablename__ = "insight_generations"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
+
+    mode = Column(String, nullable=False)  # "full" | "incremental"
+    card_ids = Column(JSON, default=list)  # 本次发送给 AI 的卡片 id
+    insight_ids = Column(JSON, default=list)  # 本次新建或更新的定律 id
+
+    # 生成开始时间：此后更新过的卡片视为未覆盖
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # 关系
+    user = relationship("User", back_populates="insight_generations")
@@ -0,0 +1,40 @@
+from sqlalchemy import Column, String, Text, Integer, DateTime, ForeignKey, JSON, Enum
+from sqlalchemy.orm import relationship
+from datetime import datetime
+import uuid
+import enum
+from app.database import Base
+
+
+class JobStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class InsightJob(Base):
+    """后台定律生成任务（持久化在数据库中，进程重启后继续执行）"""
+    __tablename__ = "insight_jobs"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
+
+    status = Column(Enum(JobStatus), default=JobStatus.QUEUED, index=True)
+    language = Column(String, default="en")  # 入队时的界面语言
+
+    # 进度：已保存的定律
+    progress = Column(Integer, default=0)
+    insight_ids = Column(JSON, default=list)
+
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    # 执行中的任务每次保存进度都会刷新，长时间未刷新视为执行它的进程已退出
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # 关系
+    user = relationship("User", back_populates="insight_jobs")
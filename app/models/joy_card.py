@@ -1,5 +1,5 @@
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, JSON, Index
+from sqlalchemy.orm import relationship, deferred
 from datetime import datetime
 import uuid
 from app.database import Base
@@ -24,11 +24,20 @@ class JoyCard(Base):
     # 卡片摘要
     card_summary = Column(String)
 
-    # 对话历史（JSON格式存储）
-    conversation_history = Column(JSON)
+    # 生成卡片的对话：完整记录在 chat_messages 中，按需通过 ChatHistoryService.load_for_card 读取
+    session_id = Column(String, ForeignKey("chat_sessions.id"), nullable=True)
+
+    # 旧版卡片的对话历史副本（JSON）；新卡片不再写入，只引用 session_id
+    # 延迟加载：查询卡片时默认不读取，访问该属性时才单独查询
+    conversation_history = deferred(Column(JSON))
 
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # 关系
     user = relationship("User", back_populates="joy_cards")
+
+    __table_args__ = (
+        # 卡片列表、计数与定律生成都按用户过滤并按 (创建时间, id) 倒序；游标分页直接在索引上定位
+        Index("ix_joy_cards_user_created_id", "user_id", created_at.desc(), id.desc()),
+    )
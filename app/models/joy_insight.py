@@ -1,5 +1,5 @@
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey, JSON, Boolean
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, JSON, Boolean, Index
+from sqlalchemy.orm import relationship, deferred
 from datetime import datetime
 import uuid
 from app.database import Base
@@ -17,8 +17,8 @@ class JoyInsight(Base):
     keywords = Column(JSON)  # 关键词列表，如["课堂演讲", "发表观点", "多人场合"]
     pattern_type = Column(String)  # 模式分类标签
 
-    # 证据（关联的卡片和引用）
-    evidence_cards = Column(JSON)  # [{"card_id": "...", "quote": "..."}]
+    # 证据（关联的卡片和引用）；延迟加载，需要时在查询中 undefer
+    evidence_cards = deferred(Column(JSON))  # [{"card_id": "...", "quote": "..."}]
 
     # 状态
     is_confirmed = Column(Boolean, default=False)
@@ -29,3 +29,8 @@ class JoyInsight(Base):
 
     # 关系
     user = relationship("User", back_populates="joy_insights")
+
+    __table_args__ = (
+        # 定律列表按用户过滤并按创建时间倒序，增量生成按用户读取已有定律
+        Index("ix_joy_insights_user_created_id", "user_id", created_at.desc(), id.desc()),
+    )
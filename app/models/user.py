@@ -19,3 +19,5 @@ class User(Base):
     joy_cards = relationship("JoyCard", back_populates="user", cascade="all, delete-orphan")
     joy_insights = relationship("JoyInsight", back_populates="user", cascade="all, delete-orphan")
     chat_sessions = relationship("ChatSession", back_populates="user", cascade="all, delete-orphan")
+    insight_generations = relationship("InsightGeneration", back_populates="user", cascade="all, delete-orphan")
+    insight_jobs = relationship("InsightJob", back_populates="user", cascade="all, delete-orphan")
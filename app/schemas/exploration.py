@@ -14,6 +14,11 @@ class RecommendationItem(BaseModel):
     confidence: Optional[int] = None
 
 
+class RecommendationList(BaseModel):
+    """AI 返回的推荐列表（结构化输出）"""
+    recommendations: List[RecommendationItem]
+
+
 class ExplorationResponse(BaseModel):
     energy_level: int
     recommendations: List[RecommendationItem]
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Literal
 
 
 class FormulaData(BaseModel):
@@ -11,6 +11,13 @@ class FormulaData(BaseModel):
     sensation: Optional[str] = None
 
 
+class FormulaResult(BaseModel):
+    """对话中 AI 提交的完整快乐公式（结构化输出）"""
+    stage: Literal["complete"]
+    formula: FormulaData
+    card_summary: str
+
+
 class JoyCardResponse(BaseModel):
     id: str
     user_id: str
@@ -21,6 +28,7 @@ class JoyCardResponse(BaseModel):
     formula_trigger: Optional[str] = None
     formula_sensation: Optional[str] = None
     card_summary: Optional[str] = None
+    session_id: Optional[str] = None
     created_at: datetime
     updated_at: datetime
 
@@ -28,6 +36,17 @@ class JoyCardResponse(BaseModel):
         from_attributes = True
 
 
+class ConversationMessage(BaseModel):
+    role: str
+    content: str
+
+
+class JoyCardConversationResponse(BaseModel):
+    card_id: str
+    messages: List[ConversationMessage]
+
+
 class JoyCardListResponse(BaseModel):
     cards: List[JoyCardResponse]
-    total: int
+    total: Optional[int] = None  # include_total=false 时不统计
+    next_cursor: Optional[str] = None  # 没有更多卡片时为 null
@@ -20,6 +20,44 @@ class JoyInsightResponse(BaseModel):
         from_attributes = True
 
 
-class GenerateInsightsResponse(BaseModel):
-    insights: List[JoyInsightResponse]
-    message: str
+class InsightEvidence(BaseModel):
+    card_id: str
+    quote: str
+
+
+class InsightDraft(BaseModel):
+    """AI 生成的一条定律（结构化输出），字段对应 JoyInsightResponse 中的 insight_text / evidence_cards 等"""
+    id: Optional[str] = None  # 增量生成时更新的已有定律
+    merged_ids: Optional[List[str]] = None  # 增量生成时被合并掉的已有定律
+    insight: str
+    statement: Optional[str] = None
+    keywords: Optional[List[str]] = None
+    evidence: List[InsightEvidence] = []
+    pattern_type: Optional[str] = None
+
+
+class InsightDraftList(BaseModel):
+    insights: List[InsightDraft]
+
+
+class InsightPattern(BaseModel):
+    """分片（map）阶段提取的候选模式"""
+    statement: str
+    keywords: Optional[List[str]] = None
+    pattern_type: Optional[str] = None
+    evidence: List[InsightEvidence] = []
+
+
+class InsightPatternList(BaseModel):
+    patterns: List[InsightPattern]
+
+
+class InsightJobResponse(BaseModel):
+    id: str
+    status: str  # queued | running | succeeded | failed
+    progress: int = 0  # 已保存的定律条数
+    insights: List[JoyInsightResponse] = []
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
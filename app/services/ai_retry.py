@@ -0,0 +1,187 @@
+"""
+AI 调用的重试与熔断
+
+- 只重试暂时性错误：429/408/5xx/529 和连接、超时错误；400/401/404 等请求本身的错误直接抛出
+- 指数退避 + 全抖动（0 ~ base * 2^n，不超过 AI_RETRY_MAX_DELAY_SECONDS）；
+  错误带 Retry-After 时至少等待该时长，超过上限则不再重试，交给 AIRouter 故障转移
+- 每个提供商一个熔断器：连续可重试错误达到阈值后熔断，期间直接失败不再请求；
+  熔断 AI_BREAKER_OPEN_SECONDS 后进入半开状态，只放行一个探测请求，成功则恢复，失败则重新熔断
+"""
+import asyncio
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+from app.config import settings
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+_transient_error_types: Optional[Tuple[type, ...]] = None
+
+
+class CircuitOpenError(Exception):
+    """提供商已熔断，请求未发出"""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"AI provider {provider} is unavailable (circuit open)")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+def _transient_errors() -> Tuple[type, ...]:
+    """各 SDK 的连接/超时错误类型（SDK 未安装时跳过）"""
+    global _transient_error_types
+    if _transient_error_types is None:
+        types = [ConnectionError, TimeoutError, asyncio.TimeoutError]
+        try:
+            import anthropic
+            types.append(anthropic.APIConnectionError)
+        except ImportError:
+            pass
+        try:
+            import openai
+            types.append(openai.APIConnectionError)
+        except ImportError:
+            pass
+        try:
+            import httpx
+            types.append(httpx.TransportError)
+        except ImportError:
+            pass
+        _transient_error_types = tuple(types)
+    return _transient_error_types
+
+
+def status_code(error: Exception) -> Optional[int]:
+    """错误对应的 HTTP 状态码：SDK 错误的 status_code、HTTP 响应的 status_code、google api_core 的 code"""
+    for source in (error, getattr(error, "response", None)):
+        code = getattr(source, "status_code", None)
+        if isinstance(code, int):
+            return code
+    code = getattr(error, "code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, CircuitOpenError):
+        return False
+    code = status_code(error)
+    if code is not None:
+        return code in RETRYABLE_STATUS_CODES
+    return isinstance(error, _transient_errors())
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """从错误响应头读取 Retry-After（秒数或 HTTP 日期；OpenAI 另有 retry-after-ms）"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return getattr(error, "retry_after", None)
+
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return max(float(value) / 1000, 0.0)
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, error: Exception) -> Optional[float]:
+    """第 attempt 次（从 0 计）失败后的等待秒数；Retry-After 超过上限时返回 None，表示不再重试"""
+    delay = random.uniform(0, min(settings.AI_RETRY_MAX_DELAY_SECONDS,
+                                  settings.AI_RETRY_BASE_DELAY_SECONDS * 2 ** attempt))
+    server_delay = retry_after(error)
+    if server_delay is not None:
+        if server_delay > settings.AI_RETRY_MAX_DELAY_SECONDS:
+            return None
+        delay = max(delay, server_delay)
+    return delay
+
+
+class CircuitBreaker:
+    """单个提供商的熔断器：closed -> open -> half_open -> closed/open"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.open_count = 0
+        self.rejected = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _remaining(self) -> float:
+        return max(self.opened_at + settings.AI_BREAKER_OPEN_SECONDS - time.monotonic(), 0.0)
+
+    def check(self) -> bool:
+        """放行时返回本次请求是否为半开探测；熔断中不放行，抛出 CircuitOpenError"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return False
+            if self.state == self.OPEN and self._remaining() <= 0:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            remaining = self._remaining()
+        raise CircuitOpenError(self.provider, remaining)
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != self.CLOSED:
+                print(f"AI 提供商 {self.provider} 探测成功，熔断恢复")
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED
+                and self.consecutive_failures >= settings.AI_BREAKER_FAILURE_THRESHOLD
+            ):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.open_count += 1
+                print(f"AI 提供商 {self.provider} 连续失败 {self.consecutive_failures} 次，熔断 "
+                      f"{settings.AI_BREAKER_OPEN_SECONDS} 秒")
+
+    def release(self) -> None:
+        """探测请求被取消（如对冲落败）时归还半开探测名额，结果不计入熔断"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == self.OPEN and self._remaining() > 0
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "open_count": self.open_count,
+                "rejected": self.rejected,
+                "retry_in": round(self._remaining(), 1) if self.state == self.OPEN else 0.0,
+            }
@@ -0,0 +1,335 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, List, Dict, Optional
+from app.config import settings
+from app.services.ai_service import AIService
+from app.services.ai_scheduler import AIScheduler, PRIORITY_INTERACTIVE, estimate_cost
+from app.services.ai_retry import CircuitBreaker, CircuitOpenError, backoff_delay, is_retryable
+from app.services.structured_output import OutputSchema
+
+
+class ProviderStats:
+    """单个提供商的延迟与错误统计（EWMA）"""
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.ewma_latency: Optional[float] = None
+        self.ewma_error_rate = 0.0
+        self.calls = 0
+        self.failures = 0
+        self.last_failure_at = 0.0
+        # 可对冲（交互式）调用的延迟样本，用于计算 p95
+        self._hedge_samples = deque(maxlen=200)
+        self._lock = threading.Lock()
+
+    def record_success(self, latency: float, hedge_eligible: bool = False) -> None:
+        with self._lock:
+            self.calls += 1
+            if self.ewma_latency is None:
+                self.ewma_latency = latency
+            else:
+                self.ewma_latency = self.alpha * latency + (1 - self.alpha) * self.ewma_latency
+            self.ewma_error_rate = (1 - self.alpha) * self.ewma_error_rate
+            if hedge_eligible:
+                self._hedge_samples.append(latency)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.calls += 1
+            self.failures += 1
+            self.last_failure_at = time.monotonic()
+            self.ewma_error_rate = self.alpha + (1 - self.alpha) * self.ewma_error_rate
+
+    def p95(self) -> Optional[float]:
+        """可对冲调用的 p95 延迟，样本不足时返回 None"""
+        with self._lock:
+            samples = sorted(self._hedge_samples)
+        if len(samples) < 20:
+            return None
+        return samples[int(len(samples) * 0.95) - 1]
+
+    @property
+    def healthy(self) -> bool:
+        # 一段时间没有新的失败后重新放回前排，让它有机会恢复
+        if time.monotonic() - self.last_failure_at > settings.AI_PROVIDER_RECOVERY_SECONDS:
+            return True
+        return self.ewma_error_rate < settings.AI_PROVIDER_ERROR_THRESHOLD
+
+    def to_dict(self) -> Dict:
+        p95 = self.p95()
+        return {
+            "ewma_latency": round(self.ewma_latency, 3) if self.ewma_latency is not None else None,
+            "ewma_error_rate": round(self.ewma_error_rate, 4),
+            "p95_latency": round(p95, 3) if p95 is not None else None,
+            "calls": self.calls,
+            "failures": self.failures,
+            "healthy": self.healthy,
+        }
+
+
+class AIRouter:
+    """
+    多提供商路由：接口与 AIService 相同
+
+    - 按 AI_PROVIDERS 顺序尝试，失败自动切换到下一个提供商
+    - 错误率（EWMA）过高的提供商排到链尾
+    - 开启对冲时，交互式请求超过当前提供商 p95 仍未返回，则并发请求下一个提供商，先返回者胜出
+    - 异步调用先经 AIScheduler 按提供商限流排队（同步调用只用于 CLI，不参与排队）
+    - 暂时性错误在同一提供商内退避重试，连续失败的提供商熔断后直接跳过（见 ai_retry）
+    """
+
+    def __init__(self, providers: Optional[List[str]] = None):
+        if providers is None:
+            providers = [p.strip() for p in settings.AI_PROVIDERS.split(",") if p.strip()] or [settings.AI_PROVIDER]
+        self.services: List[AIService] = []
+        init_error = None
+        for provider in providers:
+            try:
+                self.services.append(AIService(provider))
+            except Exception as e:
+                # 备用提供商配置不完整时跳过，不影响主提供商
+                print(f"AI 提供商 {provider} 初始化失败，已跳过: {str(e)}")
+                init_error = e
+        if not self.services:
+            raise init_error
+        self.stats: Dict[str, ProviderStats] = {
+            service.provider: ProviderStats(settings.AI_EWMA_ALPHA) for service in self.services
+        }
+        self.breakers: Dict[str, CircuitBreaker] = {
+            service.provider: CircuitBreaker(service.provider) for service in self.services
+        }
+        self.scheduler = AIScheduler([service.provider for service in self.services])
+
+    def _ordered(self) -> List[AIService]:
+        """健康的提供商在前（可选按 EWMA 延迟排序），不健康或已熔断的排到最后"""
+        healthy = [s for s in self.services if self._available(s)]
+        unhealthy = [s for s in self.services if not self._available(s)]
+        if settings.AI_ROUTE_BY_LATENCY:
+            healthy.sort(key=lambda s: self.stats[s.provider].ewma_latency or 0.0)
+        return healthy + unhealthy
+
+    def _available(self, service: AIService) -> bool:
+        return self.stats[service.provider].healthy and not self.breakers[service.provider].is_open
+
+    def _hedge_delay(self, service: AIService) -> float:
+        p95 = self.stats[service.provider].p95()
+        if p95 is None:
+            return settings.AI_HEDGE_DELAY_SECONDS
+        return max(p95, settings.AI_HEDGE_MIN_DELAY_SECONDS)
+
+    def chat(self, system_prompt: str, messages: List[Dict[str, str]],
+             temperature: float = 0.7, max_tokens: int = 2000,
+             schema: Optional[OutputSchema] = None) -> str:
+        """同 AIService.chat，按提供商链依次故障转移"""
+        last_error = None
+        for service in self._ordered():
+            try:
+                return self._chat_with_retry(service, system_prompt, messages, temperature, max_tokens, schema)
+            except Exception as e:
+                last_error = e
+                print(f"{service.provider} 调用失败，尝试下一个提供商")
+        raise last_error
+
+    def _chat_with_retry(self, service: AIService, system_prompt: str, messages: List[Dict[str, str]],
+                         temperature: float, max_tokens: int, schema: Optional[OutputSchema]) -> str:
+        attempt = 0
+        while True:
+            self.breakers[service.provider].check()
+            started = time.monotonic()
+            try:
+                reply = service.chat(system_prompt, messages, temperature, max_tokens, schema)
+            except Exception as e:
+                delay = self._record_failure(service, e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self._record_success(service, time.monotonic() - started)
+            return reply
+
+    async def achat(self, system_prompt: str, messages: List[Dict[str, str]],
+                    temperature: float = 0.7, max_tokens: int = 2000,
+                    hedge: bool = False, user_id: Optional[str] = None,
+                    priority: int = PRIORITY_INTERACTIVE,
+                    schema: Optional[OutputSchema] = None) -> str:
+        """
+        同 AIService.achat，按提供商链故障转移
+
+        Args:
+            hedge: 是否允许对冲请求（仅用于交互式对话，且需开启 AI_HEDGE_ENABLED）
+            user_id: 发起请求的用户，限流排队时按用户轮转
+            priority: 排队优先级（PRIORITY_INTERACTIVE / PRIORITY_BACKGROUND）
+            schema: 结构化输出约束，见 AIService.chat
+        """
+        candidates = self._ordered()
+        cost = estimate_cost(system_prompt, messages, max_tokens)
+        hedge = hedge and settings.AI_HEDGE_ENABLED
+        task_service: Dict[asyncio.Task, AIService] = {}
+        pending = set()
+        next_index = 0
+        last_error = None
+
+        def launch():
+            nonlocal next_index
+            service = candidates[next_index]
+            next_index += 1
+            task = asyncio.create_task(
+                self._timed_achat(service, system_prompt, messages, temperature, max_tokens, hedge,
+                                  user_id, priority, cost, schema)
+            )
+            task_service[task] = service
+            pending.add(task)
+
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if hedge and len(pending) == 1 and next_index < len(candidates):
+                    timeout = self._hedge_delay(task_service[next(iter(pending))])
+
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # 超过 p95 仍未返回，对冲到下一个提供商
+                    print(f"{task_service[next(iter(pending))].provider} 响应慢，发起对冲请求")
+                    launch()
+                    continue
+
+                for task in done:
+                    pending.discard(task)
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+
+                # 全部失败且还有候选：故障转移
+                if not pending and next_index < len(candidates):
+                    launch()
+
+            raise last_error
+        finally:
+            # 先返回者胜出，取消其余请求
+            for task in pending:
+                task.cancel()
+
+    async def _timed_achat(self, service: AIService, system_prompt: str, messages: List[Dict[str, str]],
+                           temperature: float, max_tokens: int, hedge_eligible: bool,
+                           user_id: Optional[str], priority: int, cost: int,
+                           schema: Optional[OutputSchema]) -> str:
+        attempt = 0
+        while True:
+            is_probe = self.breakers[service.provider].check()
+            try:
+                await self.scheduler.acquire(service.provider, user_id, priority, cost)
+                # 排队时间不计入提供商延迟
+                started = time.monotonic()
+                reply = await service.achat(system_prompt, messages, temperature, max_tokens, schema)
+            except asyncio.CancelledError:
+                if is_probe:
+                    self.breakers[service.provider].release()
+                raise
+            except Exception as e:
+                delay = self._record_failure(service, e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self._record_success(service, time.monotonic() - started, hedge_eligible)
+            return reply
+
+    async def astream(self, system_prompt: str, messages: List[Dict[str, str]],
+                      temperature: float = 0.7, max_tokens: int = 2000,
+                      user_id: Optional[str] = None,
+                      priority: int = PRIORITY_INTERACTIVE,
+                      schema: Optional[OutputSchema] = None) -> AsyncIterator[str]:
+        """同 AIService.astream；只在尚未输出任何片段时故障转移"""
+        cost = estimate_cost(system_prompt, messages, max_tokens)
+        last_error = None
+        for service in self._ordered():
+            attempt = 0
+            while True:
+                try:
+                    is_probe = self.breakers[service.provider].check()
+                except CircuitOpenError as e:
+                    last_error = e
+                    break
+                emitted = False
+                recorded = False
+                try:
+                    await self.scheduler.acquire(service.provider, user_id, priority, cost)
+                    # 排队时间不计入提供商延迟
+                    started = time.monotonic()
+                    async for chunk in service.astream(system_prompt, messages, temperature, max_tokens, schema):
+                        emitted = True
+                        yield chunk
+                except Exception as e:
+                    recorded = True
+                    delay = self._record_failure(service, e, attempt)
+                    if emitted:
+                        # 已经下发部分内容，无法重试或无缝切换
+                        raise
+                    if delay is not None:
+                        await asyncio.sleep(delay)
+                        attempt += 1
+                        continue
+                    last_error = e
+                    print(f"{service.provider} 流式调用失败，尝试下一个提供商")
+                    break
+                else:
+                    recorded = True
+                    self._record_success(service, time.monotonic() - started)
+                    return
+                finally:
+                    # 排队或输出途中被取消、客户端断开（GeneratorExit）时没有记录结果，
+                    # 要归还半开探测名额，否则熔断器会一直停在半开状态
+                    if is_probe and not recorded:
+                        self.breakers[service.provider].release()
+        raise last_error
+
+    def _record_success(self, service: AIService, latency: float, hedge_eligible: bool = False) -> None:
+        self.stats[service.provider].record_success(latency, hedge_eligible)
+        self.breakers[service.provider].record_success()
+
+    def _record_failure(self, service: AIService, error: Exception, attempt: int) -> Optional[float]:
+        """记录一次失败，返回重试前的等待秒数；不可重试、重试次数用完或 Retry-After 过长时返回 None"""
+        self.stats[service.provider].record_failure()
+        breaker = self.breakers[service.provider]
+        if not is_retryable(error):
+            # 请求本身的错误（400/401 等）既不说明提供商故障，也不说明已恢复：
+            # 熔断状态保持不变，只归还可能占用的半开探测名额
+            breaker.release()
+            return None
+        breaker.record_failure()
+        if attempt + 1 >= settings.AI_RETRY_MAX_ATTEMPTS or breaker.is_open:
+            return None
+        delay = backoff_delay(attempt, error)
+        if delay is not None:
+            print(f"{service.provider} 暂时性错误（{str(error)}），{delay:.2f} 秒后重试")
+        return delay
+
+    async def aclose(self) -> None:
+        """关闭各提供商持有的连接池"""
+        for service in self.services:
+            await service.aclose()
+
+    def get_cache_stats(self) -> Dict:
+        """各提供商的提示词缓存命中统计"""
+        return {service.provider: service.get_cache_stats() for service in self.services}
+
+    def get_provider_stats(self) -> Dict:
+        """各提供商的延迟与错误统计、熔断状态（按当前路由顺序）"""
+        return {
+            service.provider: dict(self.stats[service.provider].to_dict(),
+                                   circuit=self.breakers[service.provider].to_dict())
+            for service in self._ordered()
+        }
+
+    def get_scheduler_stats(self) -> Dict:
+        """各提供商的限流队列深度与等待时间"""
+        return self.scheduler.get_stats()
+
+
+# 全局 AI 服务实例
+ai_service = AIRouter()
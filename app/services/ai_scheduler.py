@@ -0,0 +1,216 @@
+"""
+AI 调用调度：每个提供商一组令牌桶（请求数 + token 数），超出速率的调用排队
+
+- 两个优先级：交互式对话（PRIORITY_INTERACTIVE）总是先于洞察/探索生成（PRIORITY_BACKGROUND）放行
+- 同一优先级内按用户轮转，单个用户的大量请求不会饿死其他用户
+- token 成本用本地估算（提示词 + max_tokens），不依赖提供商的 tokenizer
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+from app.config import settings
+from app.services.tokens import estimate_tokens, estimate_messages_tokens
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+_PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BACKGROUND: "background"}
+
+
+def estimate_cost(system_prompt: str, messages: List[Dict[str, str]], max_tokens: int) -> int:
+    """一次调用的预估 token 成本：输入按本地估算，输出按 max_tokens 上限计"""
+    return estimate_tokens(system_prompt) + estimate_messages_tokens(messages) + max_tokens
+
+
+class TokenBucket:
+    """令牌桶：容量为每分钟额度，按秒匀速补充；rate_per_minute 为 0 表示不限制"""
+
+    def __init__(self, rate_per_minute: int):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """还需等待多少秒才能取出 amount 个令牌（超过容量的请求按容量计）"""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        if self.unlimited:
+            return
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class _Waiter:
+    __slots__ = ("user_key", "priority", "cost")
+
+    def __init__(self, user_key: str, priority: int, cost: int):
+        self.user_key = user_key
+        self.priority = priority
+        self.cost = cost
+
+
+class ProviderScheduler:
+    """单个提供商的限流队列"""
+
+    def __init__(self, provider: str, rpm: int, tpm: int):
+        self.provider = provider
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        # 优先级 -> 用户 -> 该用户排队中的请求；OrderedDict 的顺序即轮转顺序
+        self._queues: Dict[int, "OrderedDict[str, deque]"] = {
+            priority: OrderedDict() for priority in _PRIORITY_NAMES
+        }
+        self._condition: Optional[asyncio.Condition] = None
+        self._loop = None
+        self._stats_lock = threading.Lock()
+        self._wait_stats = {
+            priority: {"calls": 0, "total_wait": 0.0, "max_wait": 0.0} for priority in _PRIORITY_NAMES
+        }
+
+    @property
+    def limited(self) -> bool:
+        return not (self.requests.unlimited and self.tokens.unlimited)
+
+    def _get_condition(self) -> asyncio.Condition:
+        # asyncio 原语绑定事件循环，循环变化时（如测试客户端）重新创建
+        loop = asyncio.get_running_loop()
+        if self._condition is None or self._loop is not loop:
+            self._condition = asyncio.Condition()
+            self._loop = loop
+            for queue in self._queues.values():
+                queue.clear()
+        return self._condition
+
+    async def acquire(self, user_key: str, priority: int, cost: int) -> float:
+        """排队直到令牌充足且轮到该请求，返回等待秒数"""
+        if not self.limited:
+            return 0.0
+
+        condition = self._get_condition()
+        waiter = _Waiter(user_key, priority, cost)
+        started = time.monotonic()
+        async with condition:
+            self._enqueue(waiter)
+            try:
+                while True:
+                    if self._head() is not waiter:
+                        await condition.wait()
+                        continue
+                    delay = max(self.requests.wait_time(1), self.tokens.wait_time(cost))
+                    if delay <= 0:
+                        self.requests.consume(1)
+                        self.tokens.consume(cost)
+                        break
+                    # 等令牌补充；期间有更高优先级的请求到达会被唤醒重新判断队首
+                    try:
+                        await asyncio.wait_for(condition.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                self._dequeue(waiter)
+                condition.notify_all()
+
+        waited = time.monotonic() - started
+        self._record_wait(priority, waited)
+        return waited
+
+    def _enqueue(self, waiter: _Waiter) -> None:
+        queue = self._queues[waiter.priority]
+        if waiter.user_key not in queue:
+            queue[waiter.user_key] = deque()
+        queue[waiter.user_key].append(waiter)
+
+    def _dequeue(self, waiter: _Waiter) -> None:
+        queue = self._queues[waiter.priority]
+        user_waiters = queue.get(waiter.user_key)
+        if not user_waiters or waiter not in user_waiters:
+            return
+        user_waiters.remove(waiter)
+        if user_waiters:
+            # 该用户还有请求：排到本优先级队尾，先轮到其他用户
+            queue.move_to_end(waiter.user_key)
+        else:
+            del queue[waiter.user_key]
+
+    def _head(self) -> Optional[_Waiter]:
+        """下一个应放行的请求：最高优先级中轮转到的用户的最早请求"""
+        for priority in sorted(self._queues):
+            queue = self._queues[priority]
+            if queue:
+                return queue[next(iter(queue))][0]
+        return None
+
+    def _record_wait(self, priority: int, waited: float) -> None:
+        with self._stats_lock:
+            stats = self._wait_stats[priority]
+            stats["calls"] += 1
+            stats["total_wait"] += waited
+            stats["max_wait"] = max(stats["max_wait"], waited)
+
+    def to_dict(self) -> Dict:
+        result = {
+            "rpm_limit": int(self.requests.capacity),
+            "tpm_limit": int(self.tokens.capacity),
+        }
+        with self._stats_lock:
+            for priority, name in _PRIORITY_NAMES.items():
+                queue = self._queues[priority]
+                stats = self._wait_stats[priority]
+                result[name] = {
+                    "queued": sum(len(waiters) for waiters in queue.values()),
+                    "queued_users": len(queue),
+                    "calls": stats["calls"],
+                    "avg_wait": round(stats["total_wait"] / stats["calls"], 3) if stats["calls"] else 0.0,
+                    "max_wait": round(stats["max_wait"], 3),
+                }
+        return result
+
+
+class AIScheduler:
+    """按提供商分发到各自的 ProviderScheduler"""
+
+    def __init__(self, providers: List[str]):
+        limits = AIScheduler._parse_limits(settings.AI_RATE_LIMITS)
+        self.providers: Dict[str, ProviderScheduler] = {}
+        for provider in providers:
+            rpm, tpm = limits.get(provider, (settings.AI_RPM_LIMIT, settings.AI_TPM_LIMIT))
+            self.providers[provider] = ProviderScheduler(provider, rpm, tpm)
+
+    @staticmethod
+    def _parse_limits(value: str) -> Dict[str, tuple]:
+        limits = {}
+        for item in value.split(","):
+            if not item.strip():
+                continue
+            try:
+                provider, rpm, tpm = item.strip().split(":")
+                limits[provider.strip()] = (int(rpm), int(tpm))
+            except ValueError:
+                print(f"AI_RATE_LIMITS 配置格式错误，已忽略: {item}")
+        return limits
+
+    async def acquire(self, provider: str, user_id: Optional[str], priority: int, cost: int) -> float:
+        # 未登录/系统调用共用一个匿名队列
+        return await self.providers[provider].acquire(user_id or "-", priority, cost)
+
+    def get_stats(self) -> Dict:
+        return {provider: scheduler.to_dict() for provider, scheduler in self.providers.items()}
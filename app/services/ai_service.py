@@ -1,5 +1,18 @@
-from typing import List, Dict, Optional
+import asyncio
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, List, Dict, Optional, Tuple
 from app.config import settings
+from app.i18n.state import get_language
+from app.services.ai_retry import is_retryable
+from app.services.structured_output import OutputSchema, gemini_schema, render_tool_call
+
+# Gemini 缓存因暂时性错误（超时、5xx）创建失败后，间隔多久再尝试
+_GEMINI_CACHE_RETRY_SECONDS = 300
 
 
 class AIService:
@@ -8,34 +21,66 @@ class AIService:
     def __init__(self, provider: Optional[str] = None):
         self.provider = provider or settings.AI_PROVIDER
         self._init_client()
+        self._init_cache_stats()
 
     def _init_client(self):
         """初始化对应的 AI 客户端"""
         if self.provider == "anthropic":
             import anthropic
-            self.client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
+            # 重试由 AIRouter 统一处理（退避、熔断），关闭 SDK 自带的重试
+            self.client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY, max_retries=0)
+            self.async_client = anthropic.AsyncAnthropic(api_key=settings.ANTHROPIC_API_KEY, max_retries=0)
             self.model = "claude-sonnet-4-20250514"
 
         elif self.provider == "openai":
             import openai
-            self.client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
+            self.client = openai.OpenAI(api_key=settings.OPENAI_API_KEY, max_retries=0)
+            self.async_client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY, max_retries=0)
             self.model = "gpt-4o"
 
         elif self.provider == "gemini":
             import google.generativeai as genai
             genai.configure(api_key=settings.GEMINI_API_KEY)
-            self.client = genai.GenerativeModel('gemini-3-flash-preview')
+            # 模型实例绑定系统提示词，按 (模型, 提示词哈希, 语言) 缓存复用，见 _gemini_model
+            self.client = None
+            # Gemini 的异步接口挂在模型实例上（generate_content_async）
+            self.async_client = None
             self.model = "gemini-3-flash-preview"
+            self._gemini_models: "OrderedDict[Tuple[str, str, str], Tuple[Any, float]]" = OrderedDict()
+            self._gemini_models_lock = threading.Lock()
 
         elif self.provider == "custom":
-            # 用于 Defy 或其他自定义端点
-            import requests
-            self.client = requests.Session()
+            # 用于 Defy 或其他自定义端点：同步/异步各一个带连接池的 httpx 客户端，复用 keep-alive 连接
+            self.client, self.async_client = self._custom_clients()
             self.custom_endpoint = settings.CUSTOM_AI_ENDPOINT
             self.custom_api_key = settings.CUSTOM_AI_API_KEY
 
+        elif self.provider == "stub":
+            # 本地模板回复，用于离线压测
+            from app.services.stub_provider import StubProvider
+            self.client = StubProvider()
+            self.async_client = self.client
+            self.model = "stub"
+
+    def _init_cache_stats(self):
+        """初始化提示词前缀缓存的命中统计"""
+        self._stats_lock = threading.Lock()
+        self._cache_stats = {
+            "calls": 0,
+            "cached_input_tokens": 0,     # 命中缓存的输入 token
+            "uncached_input_tokens": 0,   # 未命中缓存的输入 token（含写入缓存的部分）
+            "cache_write_tokens": 0,      # 写入缓存的输入 token（Anthropic）
+        }
+        # Gemini CachedContent: 系统提示词哈希 -> (CachedContent, 过期时间戳)
+        self._gemini_cached_contents: Dict[str, Tuple[Any, float]] = {}
+        # 缓存创建失败的系统提示词哈希 -> 下次可以重试的时间戳
+        # 暂时性错误稍后重试；请求本身被拒（如提示词低于最小缓存长度）则不再尝试
+        self._gemini_cache_retry_at: Dict[str, float] = {}
+        self._gemini_cache_lock = threading.Lock()
+
     def chat(self, system_prompt: str, messages: List[Dict[str, str]],
-             temperature: float = 0.7, max_tokens: int = 2000) -> str:
+             temperature: float = 0.7, max_tokens: int = 2000,
+             schema: Optional[OutputSchema] = None) -> str:
         """
         统一的对话接口
 
@@ -44,68 +89,536 @@ class AIService:
             messages: 消息历史 [{"role": "user"/"assistant", "content": "..."}]
             temperature: 温度参数
             max_tokens: 最大token数
+            schema: 结构化输出约束（见 structured_output），json 模式返回 JSON 文本，
+                    tool 模式在回复末尾追加工具参数的 ```json 代码块
 
         Returns:
             AI 的回复文本
         """
+        schema = self._structured(schema)
         try:
             if self.provider == "anthropic":
+                system, cached_messages = self._anthropic_cache_breakpoints(system_prompt, messages)
                 response = self.client.messages.create(
                     model=self.model,
                     max_tokens=max_tokens,
                     temperature=temperature,
-                    system=system_prompt,
-                    messages=messages
+                    system=system,
+                    messages=cached_messages,
+                    **self._anthropic_schema_kwargs(schema)
                 )
-                return response.content[0].text
+                self._record_anthropic_usage(response.usage)
+                return self._anthropic_reply(response.content, schema)
 
             elif self.provider == "openai":
+                # OpenAI 自动缓存 ≥1024 token 的相同前缀：系统提示词固定在最前，历史只追加不改写
                 formatted_messages = [{"role": "system", "content": system_prompt}] + messages
                 response = self.client.chat.completions.create(
                     model=self.model,
                     messages=formatted_messages,
                     temperature=temperature,
-                    max_tokens=max_tokens
+                    max_tokens=max_tokens,
+                    **self._openai_schema_kwargs(schema)
                 )
-                return response.choices[0].message.content
+                self._record_openai_usage(response.usage)
+                return self._openai_reply(response.choices[0].message)
 
             elif self.provider == "gemini":
-                import google.generativeai as genai
-                # 创建带 system_instruction 的模型实例
-                model = genai.GenerativeModel(self.model, system_instruction=system_prompt)
-                # 构建聊天历史（除最后一条）
-                chat_history = [{"role": "user" if msg["role"] == "user" else "model", "parts": [msg["content"]]} for msg in messages[:-1]]
-                # 启动聊天会话
-                chat = model.start_chat(history=chat_history)
-                # 发送最后一条用户消息
-                response = chat.send_message(
-                    messages[-1]["content"],
-                    generation_config=genai.GenerationConfig(
-                        temperature=temperature,
-                        max_output_tokens=max_tokens,
-                    )
+                # 复用带 system_instruction（或其缓存）的模型实例，无状态调用 generate_content
+                model = self._gemini_model(system_prompt)
+                tools = self._gemini_tools(model, schema)
+                response = model.generate_content(
+                    self._gemini_contents(messages),
+                    generation_config=self._gemini_generation_config(temperature, max_tokens, schema),
+                    tools=tools
                 )
-                return response.text
+                self._record_gemini_usage(response.usage_metadata)
+                return self._gemini_reply(response) if tools else response.text
+
+            elif self.provider == "stub":
+                return self.client.chat(system_prompt, messages, temperature, max_tokens, schema)
 
             elif self.provider == "custom":
-                # 自定义端点（Defy）
-                payload = {
-                    "system": system_prompt,
-                    "messages": messages,
-                    "temperature": temperature,
-                    "max_tokens": max_tokens
-                }
-                headers = {
-                    "Authorization": f"Bearer {self.custom_api_key}",
-                    "Content-Type": "application/json"
-                }
-                response = self.client.post(self.custom_endpoint, json=payload, headers=headers)
+                # 自定义端点（Defy）；不支持约束输出，由调用方的正则解析兜底
+                body, headers = self._custom_request(system_prompt, messages, temperature, max_tokens)
+                response = self.client.post(self.custom_endpoint, content=body, headers=headers)
+                # HTTP 错误抛出 HTTPStatusError，由 AIRouter 按状态码判断是否重试
+                response.raise_for_status()
                 return response.json()["response"]  # 根据实际返回格式调整
 
         except Exception as e:
             print(f"AI API 调用失败: {str(e)}")
             raise
 
+    async def achat(self, system_prompt: str, messages: List[Dict[str, str]],
+                    temperature: float = 0.7, max_tokens: int = 2000,
+                    schema: Optional[OutputSchema] = None) -> str:
+        """
+        异步对话接口，参数与返回值同 chat()
+
+        使用各提供商的异步客户端，等待 AI 回复期间不占用线程池
+        """
+        schema = self._structured(schema)
+        try:
+            if self.provider == "anthropic":
+                system, cached_messages = self._anthropic_cache_breakpoints(system_prompt, messages)
+                response = await self.async_client.messages.create(
+                    model=self.model,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    system=system,
+                    messages=cached_messages,
+                    **self._anthropic_schema_kwargs(schema)
+                )
+                self._record_anthropic_usage(response.usage)
+                return self._anthropic_reply(response.content, schema)
+
+            elif self.provider == "openai":
+                formatted_messages = [{"role": "system", "content": system_prompt}] + messages
+                response = await self.async_client.chat.completions.create(
+                    model=self.model,
+                    messages=formatted_messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    **self._openai_schema_kwargs(schema)
+                )
+                self._record_openai_usage(response.usage)
+                return self._openai_reply(response.choices[0].message)
+
+            elif self.provider == "gemini":
+                model = await self._agemini_model(system_prompt)
+                tools = self._gemini_tools(model, schema)
+                response = await model.generate_content_async(
+                    self._gemini_contents(messages),
+                    generation_config=self._gemini_generation_config(temperature, max_tokens, schema),
+                    tools=tools
+                )
+                self._record_gemini_usage(response.usage_metadata)
+                return self._gemini_reply(response) if tools else response.text
+
+            elif self.provider == "stub":
+                return await self.client.achat(system_prompt, messages, temperature, max_tokens, schema)
+
+            elif self.provider == "custom":
+                body, headers = self._custom_request(system_prompt, messages, temperature, max_tokens)
+                response = await self.async_client.post(self.custom_endpoint, content=body, headers=headers)
+                response.raise_for_status()
+                return response.json()["response"]
+
+        except Exception as e:
+            print(f"AI API 调用失败: {str(e)}")
+            raise
+
+    async def astream(self, system_prompt: str, messages: List[Dict[str, str]],
+                      temperature: float = 0.7, max_tokens: int = 2000,
+                      schema: Optional[OutputSchema] = None) -> AsyncIterator[str]:
+        """
+        流式对话接口，参数同 chat()
+
+        Yields:
+            AI 回复的文本片段（按提供商返回的顺序）；json 模式下是 JSON 片段，
+            tool 模式下工具参数在文本结束后以 ```json 代码块整段下发
+        """
+        if self.provider == "custom" and not settings.CUSTOM_AI_STREAM:
+            # 端点不支持流式时整段返回
+            yield await self.achat(system_prompt, messages, temperature, max_tokens, schema)
+            return
+
+        schema = self._structured(schema)
+        try:
+            if self.provider == "anthropic":
+                system, cached_messages = self._anthropic_cache_breakpoints(system_prompt, messages)
+                async with self.async_client.messages.stream(
+                    model=self.model,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    system=system,
+                    messages=cached_messages,
+                    **self._anthropic_schema_kwargs(schema)
+                ) as stream:
+                    async for event in stream:
+                        if event.type != "content_block_delta":
+                            continue
+                        if event.delta.type == "text_delta":
+                            yield event.delta.text
+                        elif event.delta.type == "input_json_delta" and schema is not None and schema.mode == "json":
+                            # 强制工具调用的参数就是 JSON 回复本身，边生成边下发
+                            yield event.delta.partial_json
+                    final_message = await stream.get_final_message()
+                    self._record_anthropic_usage(final_message.usage)
+                    if schema is not None and schema.mode == "tool":
+                        for block in final_message.content:
+                            if block.type == "tool_use":
+                                yield "\n\n" + render_tool_call(block.input)
+
+            elif self.provider == "openai":
+                formatted_messages = [{"role": "system", "content": system_prompt}] + messages
+                stream = await self.async_client.chat.completions.create(
+                    model=self.model,
+                    messages=formatted_messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **self._openai_schema_kwargs(schema)
+                )
+                # 工具调用参数按 index 分片到达，结束后整段下发
+                tool_arguments: Dict[int, str] = {}
+                async for chunk in stream:
+                    if chunk.usage:
+                        self._record_openai_usage(chunk.usage)
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if delta.content:
+                        yield delta.content
+                    for call in delta.tool_calls or []:
+                        if call.function and call.function.arguments:
+                            tool_arguments[call.index] = tool_arguments.get(call.index, "") + call.function.arguments
+                for index in sorted(tool_arguments):
+                    data = self._loads_arguments(tool_arguments[index])
+                    if data is not None:
+                        yield "\n\n" + render_tool_call(data)
+
+            elif self.provider == "gemini":
+                model = await self._agemini_model(system_prompt)
+                tools = self._gemini_tools(model, schema)
+                response = await model.generate_content_async(
+                    self._gemini_contents(messages),
+                    generation_config=self._gemini_generation_config(temperature, max_tokens, schema),
+                    tools=tools,
+                    stream=True
+                )
+                tool_calls = []
+                async for chunk in response:
+                    if tools:
+                        text, calls = self._gemini_parts(chunk)
+                        tool_calls.extend(calls)
+                    else:
+                        text = chunk.text
+                    if text:
+                        yield text
+                for data in tool_calls:
+                    yield "\n\n" + render_tool_call(data)
+                self._record_gemini_usage(response.usage_metadata)
+
+            elif self.provider == "stub":
+                async for chunk in self.client.astream(system_prompt, messages, temperature, max_tokens, schema):
+                    yield chunk
+
+            elif self.provider == "custom":
+                # SSE：每行 data: {"response": "片段"}，data: [DONE] 结束；非 JSON 的 data 按原文下发
+                body, headers = self._custom_request(system_prompt, messages, temperature, max_tokens, stream=True)
+                async with self.async_client.stream(
+                    "POST", self.custom_endpoint, content=body, headers=headers
+                ) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        try:
+                            text = json.loads(data).get("response")
+                        except (ValueError, AttributeError):
+                            text = data
+                        if text:
+                            yield text
+
+        except Exception as e:
+            print(f"AI API 流式调用失败: {str(e)}")
+            raise
+
+    # ── 自定义端点 ──────────────────────────────────
+
+    @staticmethod
+    def _custom_clients():
+        """自定义端点的 httpx 客户端：连接/读取超时、连接池上限、keep-alive，安装了 h2 时启用 HTTP/2"""
+        import httpx
+
+        http2 = settings.CUSTOM_AI_HTTP2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                http2 = False
+        options = {
+            "timeout": httpx.Timeout(settings.CUSTOM_AI_READ_TIMEOUT, connect=settings.CUSTOM_AI_CONNECT_TIMEOUT),
+            "limits": httpx.Limits(
+                max_connections=settings.CUSTOM_AI_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.CUSTOM_AI_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.CUSTOM_AI_KEEPALIVE_EXPIRY,
+            ),
+            "http2": http2,
+        }
+        return httpx.Client(**options), httpx.AsyncClient(**options)
+
+    def _custom_request(self, system_prompt: str, messages: List[Dict[str, str]], temperature: float,
+                        max_tokens: int, stream: bool = False) -> Tuple[bytes, Dict[str, str]]:
+        """请求体与请求头；开启 CUSTOM_AI_GZIP_REQUESTS 时请求体 gzip 压缩（响应的解压由 httpx 自动处理）"""
+        payload = {
+            "system": system_prompt,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        if stream:
+            payload["stream"] = True
+        headers = {"Content-Type": "application/json"}
+        if self.custom_api_key:
+            headers["Authorization"] = f"Bearer {self.custom_api_key}"
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        if settings.CUSTOM_AI_GZIP_REQUESTS:
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+        return body, headers
+
+    async def aclose(self) -> None:
+        """关闭连接池（应用退出时调用）"""
+        if self.provider == "custom":
+            self.client.close()
+            await self.async_client.aclose()
+
+    # ── 结构化输出 ──────────────────────────────────
+
+    @staticmethod
+    def _structured(schema: Optional[OutputSchema]) -> Optional[OutputSchema]:
+        return schema if settings.STRUCTURED_OUTPUT_ENABLED else None
+
+    @staticmethod
+    def _join_reply(text: str, tool_calls: List[Dict]) -> str:
+        """回复文本 + 工具参数代码块（tool 模式）"""
+        parts = [text.strip()] if text and text.strip() else []
+        parts.extend(render_tool_call(data) for data in tool_calls)
+        return "\n\n".join(parts)
+
+    @staticmethod
+    def _loads_arguments(arguments: str) -> Optional[Dict]:
+        try:
+            return json.loads(arguments)
+        except ValueError:
+            print(f"工具调用参数不是合法 JSON，已忽略: {arguments[:200]}")
+            return None
+
+    @staticmethod
+    def _anthropic_schema_kwargs(schema: Optional[OutputSchema]) -> Dict:
+        """json 模式强制调用同名工具（参数即结构化回复），tool 模式由模型自行决定是否调用"""
+        if schema is None:
+            return {}
+        tool = {"name": schema.name, "description": schema.description, "input_schema": schema.json_schema}
+        if schema.mode == "json":
+            return {"tools": [tool], "tool_choice": {"type": "tool", "name": schema.name}}
+        return {"tools": [tool]}
+
+    def _anthropic_reply(self, content, schema: Optional[OutputSchema]) -> str:
+        texts = [block.text for block in content if block.type == "text"]
+        tool_calls = [block.input for block in content if block.type == "tool_use"]
+        if schema is not None and schema.mode == "json" and tool_calls:
+            return json.dumps(tool_calls[0], ensure_ascii=False)
+        return self._join_reply("".join(texts), tool_calls)
+
+    @staticmethod
+    def _openai_schema_kwargs(schema: Optional[OutputSchema]) -> Dict:
+        if schema is None:
+            return {}
+        if schema.mode == "json":
+            # 非 strict：schema 中的可选字段不必全部列入 required
+            return {"response_format": {"type": "json_schema", "json_schema": {
+                "name": schema.name, "description": schema.description, "schema": schema.json_schema
+            }}}
+        return {"tools": [{"type": "function", "function": {
+            "name": schema.name, "description": schema.description, "parameters": schema.json_schema
+        }}]}
+
+    def _openai_reply(self, message) -> str:
+        tool_calls = [self._loads_arguments(call.function.arguments) for call in message.tool_calls or []]
+        return self._join_reply(message.content or "", [data for data in tool_calls if data is not None])
+
+    @staticmethod
+    def _gemini_generation_config(temperature: float, max_tokens: int, schema: Optional[OutputSchema]):
+        import google.generativeai as genai
+        config = {"temperature": temperature, "max_output_tokens": max_tokens}
+        if schema is not None and schema.mode == "json":
+            config["response_mime_type"] = "application/json"
+            config["response_schema"] = gemini_schema(schema.json_schema)
+        return genai.GenerationConfig(**config)
+
+    @staticmethod
+    def _gemini_tools(model, schema: Optional[OutputSchema]) -> Optional[List]:
+        import google.generativeai as genai
+        if schema is None or schema.mode != "tool":
+            return None
+        if getattr(model, "cached_content", None):
+            # 绑定 CachedContent 的模型不能在请求中另加 tools，由正则解析兜底
+            return None
+        return [{"function_declarations": [genai.types.FunctionDeclaration(
+            name=schema.name, description=schema.description, parameters=gemini_schema(schema.json_schema)
+        )]}]
+
+    @staticmethod
+    def _gemini_parts(response) -> Tuple[str, List[Dict]]:
+        """拆出文本与函数调用参数（含函数调用时 response.text 会抛错）"""
+        texts, tool_calls = [], []
+        for candidate in response.candidates[:1]:
+            for part in candidate.content.parts:
+                if "function_call" in part:
+                    call = part.function_call
+                    tool_calls.append(type(call).to_dict(call).get("args", {}))
+                elif part.text:
+                    texts.append(part.text)
+        return "".join(texts), tool_calls
+
+    def _gemini_reply(self, response) -> str:
+        text, tool_calls = self._gemini_parts(response)
+        return self._join_reply(text, tool_calls)
+
+    # ── 提示词前缀缓存 ──────────────────────────────────
+
+    @staticmethod
+    def _anthropic_cache_breakpoints(system_prompt: str,
+                                     messages: List[Dict[str, str]]) -> Tuple[Any, List[Dict]]:
+        """
+        为 Anthropic 请求加 cache_control 断点
+
+        断点 1：系统提示词（各语言固定，跨会话共享）
+        断点 2：本轮新消息之前的历史前缀（下一轮会原样出现在前缀中）
+        """
+        if not settings.PROMPT_CACHE_ENABLED:
+            return system_prompt, messages
+
+        system = [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}]
+        if len(messages) < 2:
+            return system, messages
+
+        cached_messages = list(messages)
+        prefix_last = cached_messages[-2]
+        cached_messages[-2] = {
+            "role": prefix_last["role"],
+            "content": [{"type": "text", "text": prefix_last["content"], "cache_control": {"type": "ephemeral"}}]
+        }
+        return system, cached_messages
+
+    @staticmethod
+    def _gemini_contents(messages: List[Dict[str, str]]) -> List[Dict]:
+        """把消息历史转换为 Gemini contents（assistant -> model）"""
+        return [{"role": "user" if msg["role"] == "user" else "model", "parts": [msg["content"]]}
+                for msg in messages]
+
+    def _gemini_model_key(self, system_prompt: str) -> Tuple[str, str, str]:
+        return (self.model, hashlib.sha256(system_prompt.encode("utf-8")).hexdigest(), get_language())
+
+    def _lookup_gemini_model(self, key: Tuple[str, str, str]):
+        """从 LRU 中取未过期的模型实例"""
+        with self._gemini_models_lock:
+            entry = self._gemini_models.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                # 绑定的 CachedContent 已过期
+                del self._gemini_models[key]
+                return None
+            self._gemini_models.move_to_end(key)
+            return entry[0]
+
+    def _gemini_model(self, system_prompt: str):
+        """返回绑定系统提示词的模型实例（LRU 复用，避免每次请求重新构建）"""
+        key = self._gemini_model_key(system_prompt)
+        model = self._lookup_gemini_model(key)
+        if model is not None:
+            return model
+
+        model, expires_at = self._build_gemini_model(system_prompt)
+        with self._gemini_models_lock:
+            self._gemini_models[key] = (model, expires_at)
+            self._gemini_models.move_to_end(key)
+            while len(self._gemini_models) > settings.GEMINI_MODEL_CACHE_SIZE:
+                self._gemini_models.popitem(last=False)
+        return model
+
+    async def _agemini_model(self, system_prompt: str):
+        """异步版本：命中 LRU 直接返回，未命中时构建（可能创建 CachedContent）放到线程中执行"""
+        model = self._lookup_gemini_model(self._gemini_model_key(system_prompt))
+        if model is not None:
+            return model
+        return await asyncio.to_thread(self._gemini_model, system_prompt)
+
+    def _build_gemini_model(self, system_prompt: str) -> Tuple[Any, float]:
+        """构建模型实例，返回 (模型, 失效时间戳)；无法缓存系统提示词时退回普通实例"""
+        import google.generativeai as genai
+
+        cached = self._gemini_cached_content(system_prompt) if settings.PROMPT_CACHE_ENABLED else None
+        if cached is not None:
+            cached_content, expires_at = cached
+            return genai.GenerativeModel.from_cached_content(cached_content=cached_content), expires_at
+        return genai.GenerativeModel(self.model, system_instruction=system_prompt), float("inf")
+
+    def _gemini_cached_content(self, system_prompt: str) -> Optional[Tuple[Any, float]]:
+        """获取（必要时创建）系统提示词对应的 Gemini CachedContent，返回 (缓存, 失效时间戳)"""
+        from google.generativeai import caching
+
+        key = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+        # 加锁，避免并发请求重复创建同一份缓存
+        with self._gemini_cache_lock:
+            entry = self._gemini_cached_contents.get(key)
+            if entry and entry[1] > time.time():
+                return entry
+            if self._gemini_cache_retry_at.get(key, 0) > time.time():
+                return None
+
+            ttl = settings.GEMINI_CACHE_TTL_SECONDS
+            try:
+                cached_content = caching.CachedContent.create(
+                    model=f"models/{self.model}",
+                    system_instruction=system_prompt,
+                    ttl=ttl
+                )
+            except Exception as e:
+                print(f"Gemini 缓存创建失败，改用普通请求: {str(e)}")
+                retry_in = _GEMINI_CACHE_RETRY_SECONDS if is_retryable(e) else float("inf")
+                self._gemini_cache_retry_at[key] = time.time() + retry_in
+                return None
+
+            # 提前一分钟视为过期，避免请求途中缓存失效
+            entry = (cached_content, time.time() + ttl - 60)
+            self._gemini_cached_contents[key] = entry
+            self._gemini_cache_retry_at.pop(key, None)
+            return entry
+
+    def _record_usage(self, cached: int, uncached: int, cache_write: int = 0):
+        with self._stats_lock:
+            self._cache_stats["calls"] += 1
+            self._cache_stats["cached_input_tokens"] += cached
+            self._cache_stats["uncached_input_tokens"] += uncached
+            self._cache_stats["cache_write_tokens"] += cache_write
+
+    def _record_anthropic_usage(self, usage):
+        if usage is None:
+            return
+        cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+        cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+        # input_tokens 只统计最后一个断点之后的未缓存部分
+        self._record_usage(cache_read, usage.input_tokens + cache_write, cache_write)
+
+    def _record_openai_usage(self, usage):
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = (getattr(details, "cached_tokens", None) or 0) if details else 0
+        self._record_usage(cached, usage.prompt_tokens - cached)
+
+    def _record_gemini_usage(self, usage_metadata):
+        if usage_metadata is None:
+            return
+        cached = getattr(usage_metadata, "cached_content_token_count", 0) or 0
+        # prompt_token_count 包含缓存部分
+        self._record_usage(cached, usage_metadata.prompt_token_count - cached)
 
-# 全局 AI 服务实例
-ai_service = AIService()
+    def get_cache_stats(self) -> Dict:
+        """提示词缓存命中统计（进程内累计）"""
+        with self._stats_lock:
+            stats = dict(self._cache_stats)
+        total = stats["cached_input_tokens"] + stats["uncached_input_tokens"]
+        stats["provider"] = self.provider
+        stats["hit_ratio"] = round(stats["cached_input_tokens"] / total, 4) if total else 0.0
+        return stats
@@ -0,0 +1,56 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Hashable, Optional
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    created_at: float = field(default_factory=time.time)
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.created_at
+
+
+class TTLCache:
+    """线程安全的 LRU + TTL 进程内缓存"""
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        """
+        Args:
+            maxsize: 最大条目数，超出时淘汰最久未使用的条目
+            ttl: 条目存活秒数，None 表示只按 LRU 淘汰
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[CacheEntry]:
+        """返回未过期的条目（含写入时间，便于调用方判断新鲜度），不存在返回 None"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if self.ttl is not None and entry.age >= self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = CacheEntry(value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -1,17 +1,27 @@
-from typing import List, Optional
+from typing import List, Optional, Tuple
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
 from app.models.joy_card import JoyCard
+from app.schemas.joy_card import JoyCardResponse
+from app.services.pagination import keyset_page
+
+# 列表只查询 JoyCardResponse 需要的列，不读取 conversation_history 等大字段
+_LIST_COLUMNS = tuple(getattr(JoyCard, name) for name in JoyCardResponse.model_fields)
 
 
 class CardService:
     """卡片业务逻辑"""
 
     @staticmethod
-    def get_user_cards(db: Session, user_id: str, skip: int = 0, limit: int = 20) -> List[JoyCard]:
-        """获取用户的卡片列表"""
-        return db.query(JoyCard).filter(
-            JoyCard.user_id == user_id
-        ).order_by(JoyCard.created_at.desc()).offset(skip).limit(limit).all()
+    def get_user_cards(db: Session, user_id: str, skip: int = 0, limit: int = 20,
+                       cursor: Optional[str] = None) -> Tuple[List[Row], Optional[str]]:
+        """
+        获取用户的卡片列表（按列投影的只读行，字段同 JoyCardResponse），新的在前
+
+        传入 cursor 时按游标翻页并忽略 skip；返回 (本页卡片, 下一页游标)
+        """
+        query = db.query(*_LIST_COLUMNS).filter(JoyCard.user_id == user_id)
+        return keyset_page(query, JoyCard.created_at, JoyCard.id, limit, cursor=cursor, offset=skip)
 
     @staticmethod
     def get_card(db: Session, card_id: str, user_id: str) -> Optional[JoyCard]:
@@ -0,0 +1,42 @@
+"""
+对话消息存储
+
+消息逐条追加到 chat_messages 表，每轮只写入新增的消息，不再重写整段历史。
+ChatSession.message_count 记录已有条数（即下一条的序号）；更新它会同时递增会话版本号，
+因此并发追加会被乐观锁拦下。
+"""
+from typing import Dict, List
+from sqlalchemy.orm import Session
+from app.models.chat_session import ChatSession
+from app.models.chat_message import ChatMessage
+from app.models.joy_card import JoyCard
+
+
+class ChatHistoryService:
+    """会话消息的读取与追加"""
+
+    @staticmethod
+    def load(db: Session, session_id: str) -> List[Dict]:
+        """按序号读取完整历史 [{"role": ..., "content": ...}]"""
+        rows = db.query(ChatMessage.role, ChatMessage.content).filter(
+            ChatMessage.session_id == session_id
+        ).order_by(ChatMessage.seq).all()
+        return [{"role": role, "content": content} for role, content in rows]
+
+    @staticmethod
+    def load_for_card(db: Session, card: JoyCard) -> List[Dict]:
+        """卡片对应的对话：引用会话的读取会话消息，旧版卡片使用自带的 JSON 副本"""
+        if card.session_id:
+            return ChatHistoryService.load(db, card.session_id)
+        return card.conversation_history or []
+
+    @staticmethod
+    def append(db: Session, session: ChatSession, messages: List[Dict]) -> None:
+        """追加消息（不提交，由调用方的事务一起提交）；新建未 flush 的会话先 flush 以获得 id"""
+        if session.id is None:
+            db.flush()
+        seq = session.message_count or 0
+        for msg in messages:
+            db.add(ChatMessage(session_id=session.id, seq=seq, role=msg["role"], content=msg["content"]))
+            seq += 1
+        session.message_count = seq
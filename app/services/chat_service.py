@@ -1,11 +1,63 @@
-from typing import Dict, List, Optional
-from app.services.ai_service import ai_service
+from typing import AsyncIterator, Dict, List, Optional
+from app.services.ai_router import ai_service
+from app.services.token_budget import HistoryBudget
+from app.services.prompt_format import prompt_stats
+from app.services.structured_output import FORMULA_OUTPUT
 from app.i18n.state import get_language
 from app.i18n.translations import JOY_COACH_SYSTEM_PROMPT, CHAT_INITIAL_MESSAGE
 import json
 import re
 
 
+class _FormulaBlockFilter:
+    """流式输出时过滤 ```json 代码块，公式 JSON 不下发给用户"""
+
+    OPEN = "```json"
+    CLOSE = "```"
+
+    def __init__(self):
+        self._buffer = ""
+        self._in_block = False
+
+    def feed(self, chunk: str) -> str:
+        """喂入一个片段，返回可以立即展示的文本"""
+        self._buffer += chunk
+        visible = []
+        while True:
+            if self._in_block:
+                end = self._buffer.find(self.CLOSE)
+                if end == -1:
+                    # 保留末尾可能被截断的闭合标记
+                    self._buffer = self._buffer[-(len(self.CLOSE) - 1):]
+                    break
+                self._buffer = self._buffer[end + len(self.CLOSE):]
+                self._in_block = False
+            else:
+                start = self._buffer.find(self.OPEN)
+                if start == -1:
+                    # 末尾可能是 ```json 的前半段，先扣住
+                    keep = self._partial_open_len()
+                    visible.append(self._buffer[:len(self._buffer) - keep])
+                    self._buffer = self._buffer[len(self._buffer) - keep:]
+                    break
+                visible.append(self._buffer[:start])
+                self._buffer = self._buffer[start + len(self.OPEN):]
+                self._in_block = True
+        return "".join(visible)
+
+    def flush(self) -> str:
+        """流结束时取出剩余可展示文本（未闭合的代码块直接丢弃）"""
+        rest = "" if self._in_block else self._buffer
+        self._buffer = ""
+        return rest
+
+    def _partial_open_len(self) -> int:
+        for k in range(len(self.OPEN) - 1, 0, -1):
+            if self._buffer.endswith(self.OPEN[:k]):
+                return k
+        return 0
+
+
 class ChatService:
     """对话服务：处理与用户的交互逻辑"""
 
@@ -18,28 +70,113 @@ class ChatService:
         }
 
     @staticmethod
-    def process_message(conversation_history: List[Dict], user_message: str) -> Dict:
+    def process_message(conversation_history: List[Dict], user_message: str,
+                        summary: Optional[Dict] = None) -> Dict:
         """
         处理用户消息并返回AI回复
 
+        Args:
+            conversation_history: 完整的消息历史
+            user_message: 用户新消息
+            summary: 会话的滚动摘要 {"text": ..., "message_count": ...}，历史超出 token 预算时使用
+
         Returns:
             {
                 "assistant_reply": "AI的回复",
                 "is_complete": True/False,
-                "formula": {...} if is_complete else None
+                "formula": {...} if is_complete else None,
+                "updated_history": [...],
+                "summary": 更新后的滚动摘要（可能为 None）
             }
         """
         # 添加用户消息到历史
         messages = conversation_history + [{"role": "user", "content": user_message}]
 
-        # 调用AI
+        # 按 token 预算裁剪历史（较早的轮次替换为摘要）
         lang = get_language()
+        context, summary = HistoryBudget.prepare(messages, summary, lang)
+        ChatService._record_prompt(lang, context)
+
+        # 调用AI
         ai_reply = ai_service.chat(
             system_prompt=JOY_COACH_SYSTEM_PROMPT[lang],
-            messages=messages,
-            temperature=0.7
+            messages=context,
+            temperature=0.7,
+            schema=FORMULA_OUTPUT
+        )
+
+        return ChatService._build_result(messages, ai_reply, lang, summary)
+
+    @staticmethod
+    async def aprocess_message(conversation_history: List[Dict], user_message: str,
+                               summary: Optional[Dict] = None, user_id: Optional[str] = None) -> Dict:
+        """process_message 的异步版本，返回结构相同；user_id 用于 AI 调用限流排队"""
+        messages = conversation_history + [{"role": "user", "content": user_message}]
+
+        lang = get_language()
+        context, summary = await HistoryBudget.aprepare(messages, summary, lang, user_id)
+        ChatService._record_prompt(lang, context)
+
+        # 交互式对话允许对冲请求，降低尾延迟
+        ai_reply = await ai_service.achat(
+            system_prompt=JOY_COACH_SYSTEM_PROMPT[lang],
+            messages=context,
+            temperature=0.7,
+            hedge=True,
+            user_id=user_id,
+            schema=FORMULA_OUTPUT
         )
 
+        return ChatService._build_result(messages, ai_reply, lang, summary)
+
+    @staticmethod
+    async def astream_message(conversation_history: List[Dict], user_message: str,
+                              summary: Optional[Dict] = None,
+                              user_id: Optional[str] = None) -> AsyncIterator[Dict]:
+        """
+        流式处理用户消息
+
+        Yields:
+            {"type": "delta", "text": "..."}  可展示的回复片段（不含 ```json 公式块）
+            {"type": "done", "result": {...}}  结束事件，result 与 process_message 返回结构相同
+        """
+        messages = conversation_history + [{"role": "user", "content": user_message}]
+
+        lang = get_language()
+        context, summary = await HistoryBudget.aprepare(messages, summary, lang, user_id)
+        ChatService._record_prompt(lang, context)
+
+        block_filter = _FormulaBlockFilter()
+        parts = []
+        async for chunk in ai_service.astream(
+            system_prompt=JOY_COACH_SYSTEM_PROMPT[lang],
+            messages=context,
+            temperature=0.7,
+            user_id=user_id,
+            schema=FORMULA_OUTPUT
+        ):
+            parts.append(chunk)
+            visible = block_filter.feed(chunk)
+            if visible:
+                yield {"type": "delta", "text": visible}
+
+        tail = block_filter.flush()
+        if tail:
+            yield {"type": "delta", "text": tail}
+
+        # 公式在整段回复到齐后再解析
+        yield {"type": "done", "result": ChatService._build_result(messages, "".join(parts), lang, summary)}
+
+    @staticmethod
+    def _record_prompt(lang: str, context: List[Dict]) -> None:
+        prompt_stats.record(
+            "chat", JOY_COACH_SYSTEM_PROMPT[lang], {"history": "\n".join(msg["content"] for msg in context)}
+        )
+
+    @staticmethod
+    def _build_result(messages: List[Dict], ai_reply: str, lang: str,
+                      summary: Optional[Dict] = None) -> Dict:
+        """根据 AI 回复组装 process_message 的返回结构"""
         # 检查是否包含完整的公式（检测JSON输出）
         formula_data = ChatService._extract_formula(ai_reply)
 
@@ -56,22 +193,20 @@ class ChatService:
             "assistant_reply": display_reply,
             "is_complete": formula_data is not None,
             "formula": formula_data,
-            "updated_history": messages + [{"role": "assistant", "content": ai_reply}]  # 保留完整内容到历史
+            "updated_history": messages + [{"role": "assistant", "content": ai_reply}],  # 保留完整内容到历史
+            "summary": summary
         }
 
     @staticmethod
     def _extract_formula(ai_reply: str) -> Optional[Dict]:
         """从AI回复中提取公式JSON"""
-        # 查找JSON代码块
-        json_match = re.search(r'```json\s*(\{.*?\})\s*```', ai_reply, re.DOTALL)
-        if not json_match:
-            return None
-
-        try:
-            data = json.loads(json_match.group(1))
+        # 查找JSON代码块；结构化输出的工具调用还原在回复末尾，优先取最后一个
+        for json_match in reversed(list(re.finditer(r'```json\s*(\{.*?\})\s*```', ai_reply, re.DOTALL))):
+            try:
+                data = json.loads(json_match.group(1))
+            except json.JSONDecodeError:
+                continue
             if data.get("stage") == "complete" and "formula" in data:
                 return data
-        except json.JSONDecodeError:
-            return None
 
         return None
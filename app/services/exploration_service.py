@@ -1,5 +1,12 @@
-from typing import List, Dict
-from app.services.ai_service import ai_service
+import asyncio
+import hashlib
+from typing import List, Dict, Optional, Tuple
+from app.config import settings
+from app.services.ai_router import ai_service
+from app.services.ai_scheduler import PRIORITY_BACKGROUND
+from app.services.cache import TTLCache
+from app.services.prompt_format import format_cards, format_table, prompt_stats
+from app.services.structured_output import RECOMMENDATIONS_OUTPUT, parse_json
 from app.models.joy_card import JoyCard
 from app.models.joy_insight import JoyInsight
 from app.i18n.state import get_language
@@ -8,6 +15,18 @@ import json
 import re
 
 
+# 推荐缓存：超过新鲜期后仍可返回（同时后台刷新），直到 TTL + 过期窗口后淘汰
+_recommendation_cache = TTLCache(
+    maxsize=settings.RECOMMENDATION_CACHE_SIZE,
+    ttl=settings.RECOMMENDATION_CACHE_TTL_SECONDS + settings.RECOMMENDATION_CACHE_STALE_SECONDS
+)
+# 每个 (用户, 能量值, 语言) 最近一次成功的推荐，AI 调用失败时兜底
+_last_good_recommendations = TTLCache(maxsize=settings.RECOMMENDATION_CACHE_SIZE)
+# 正在后台刷新的缓存键，以及任务引用（防止被回收）
+_refreshing_keys = set()
+_refresh_tasks = set()
+
+
 class ExplorationService:
     """快乐盲盒探索服务"""
 
@@ -25,40 +44,137 @@ class ExplorationService:
         Returns:
             推荐列表
         """
-        # 构建数据
-        insights_data = [{"insight": i.insight_text, "statement": i.statement,
-                          "keywords": i.keywords, "type": i.pattern_type}
-                         for i in insights if not i.is_rejected]
-
-        cards_data = [{"summary": c.card_summary, "raw": c.raw_input}
-                      for c in recent_cards[:5]]
-
-        lang = get_language()
-        prompt = EXPLORATION_PROMPT[lang].format(
-            energy_level=energy_level,
-            insights_json=json.dumps(insights_data, ensure_ascii=False, indent=2),
-            cards_json=json.dumps(cards_data, ensure_ascii=False, indent=2)
-        )
+        system_prompt, prompt = ExplorationService._build_prompt(energy_level, insights, recent_cards)
 
         # 调用AI
         ai_reply = ai_service.chat(
-            system_prompt=EXPLORATION_SYSTEM_PROMPT[lang],
+            system_prompt=system_prompt,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.9,
-            max_tokens=2000
+            max_tokens=2000,
+            schema=RECOMMENDATIONS_OUTPUT
         )
 
         # 提取推荐
         recommendations = ExplorationService._extract_recommendations(ai_reply)
         return recommendations
 
+    @staticmethod
+    async def arecommend_cached(user_id: str, energy_level: int, insights: List[JoyInsight],
+                                recent_cards: List[JoyCard]) -> List[Dict]:
+        """
+        带缓存的推荐（stale-while-revalidate）
+
+        缓存键为 (用户, 能量值, 未否决定律与最近卡片的摘要, 语言)：
+        - 新鲜期内直接返回缓存
+        - 过期窗口内先返回旧结果，同时后台刷新
+        - AI 调用失败时返回该用户同能量值最近一次成功的推荐
+        """
+        lang = get_language()
+        key = (user_id, energy_level, ExplorationService._data_digest(insights, recent_cards), lang)
+        last_good_key = (user_id, energy_level, lang)
+
+        entry = _recommendation_cache.get(key)
+        if entry is not None:
+            if entry.age >= settings.RECOMMENDATION_CACHE_TTL_SECONDS and key not in _refreshing_keys:
+                # 提示词在请求内构建好，后台任务不再访问 ORM 对象
+                system_prompt, prompt = ExplorationService._build_prompt(energy_level, insights, recent_cards)
+                _refreshing_keys.add(key)
+                task = asyncio.create_task(
+                    ExplorationService._refresh(key, last_good_key, system_prompt, prompt, user_id)
+                )
+                _refresh_tasks.add(task)
+                task.add_done_callback(_refresh_tasks.discard)
+            return entry.value
+
+        system_prompt, prompt = ExplorationService._build_prompt(energy_level, insights, recent_cards)
+        try:
+            recommendations = await ExplorationService._arequest(system_prompt, prompt, user_id)
+        except Exception:
+            last_good = _last_good_recommendations.get(last_good_key)
+            if last_good is not None:
+                return last_good.value
+            raise
+
+        if not recommendations:
+            # 回复无法解析时不写缓存，有旧结果则用旧结果
+            last_good = _last_good_recommendations.get(last_good_key)
+            return last_good.value if last_good is not None else recommendations
+
+        _recommendation_cache.set(key, recommendations)
+        _last_good_recommendations.set(last_good_key, recommendations)
+        return recommendations
+
+    @staticmethod
+    async def _refresh(key: Tuple, last_good_key: Tuple, system_prompt: str, prompt: str,
+                       user_id: str) -> None:
+        """后台刷新缓存，失败时保留旧结果"""
+        try:
+            recommendations = await ExplorationService._arequest(system_prompt, prompt, user_id)
+            if recommendations:
+                _recommendation_cache.set(key, recommendations)
+                _last_good_recommendations.set(last_good_key, recommendations)
+        except Exception as e:
+            print(f"推荐后台刷新失败: {str(e)}")
+        finally:
+            _refreshing_keys.discard(key)
+
+    @staticmethod
+    async def _arequest(system_prompt: str, prompt: str, user_id: Optional[str] = None) -> List[Dict]:
+        ai_reply = await ai_service.achat(
+            system_prompt=system_prompt,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.9,
+            max_tokens=2000,
+            user_id=user_id,
+            priority=PRIORITY_BACKGROUND,
+            schema=RECOMMENDATIONS_OUTPUT
+        )
+
+        return ExplorationService._extract_recommendations(ai_reply)
+
+    @staticmethod
+    def _data_digest(insights: List[JoyInsight], recent_cards: List[JoyCard]) -> str:
+        """推荐输入数据的摘要：未否决的定律 + 最近 5 张卡片（含更新时间）"""
+        parts = sorted(f"i:{i.id}:{i.updated_at}" for i in insights if not i.is_rejected)
+        parts += [f"c:{c.id}:{c.updated_at}" for c in recent_cards[:5]]
+        return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _build_prompt(energy_level: int, insights: List[JoyInsight],
+                      recent_cards: List[JoyCard]) -> Tuple[str, str]:
+        """构建推荐的 (系统提示词, 用户提示词)"""
+        # 构建数据（紧凑表格）
+        insights_table = format_table(
+            ("insight", "statement", "keywords", "type"),
+            [[i.insight_text, i.statement, i.keywords, i.pattern_type] for i in insights if not i.is_rejected]
+        )
+        cards_table = format_cards(recent_cards[:5], ("summary", "raw_input"))
+
+        lang = get_language()
+        prompt = EXPLORATION_PROMPT[lang].format(
+            energy_level=energy_level,
+            insights_table=insights_table,
+            cards_table=cards_table
+        )
+        prompt_stats.record(
+            "exploration", EXPLORATION_SYSTEM_PROMPT[lang],
+            {"insights": insights_table, "cards": cards_table}, prompt
+        )
+        return EXPLORATION_SYSTEM_PROMPT[lang], prompt
+
     @staticmethod
     def _extract_recommendations(ai_reply: str) -> List[Dict]:
         """从AI回复中提取推荐JSON"""
         if not ai_reply:
             return []
 
-        # 尝试匹配 ```json ... ``` 代码块
+        # 结构化输出：整段回复就是 JSON
+        data = parse_json(ai_reply)
+        if isinstance(data, dict):
+            return data.get("recommendations", [])
+
+        # 兜底：尝试匹配 ```json ... ``` 代码块
         json_match = re.search(r'```json\s*(.*?)\s*```', ai_reply, re.DOTALL)
         if json_match:
             try:
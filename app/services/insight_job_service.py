@@ -0,0 +1,177 @@
+"""
+后台定律生成任务
+
+任务存放在 insight_jobs 表中，由进程内的 worker 池执行：
+- 入队后立即唤醒空闲 worker，另有 INSIGHT_JOB_POLL_SECONDS 轮询兜底
+- 通过条件更新（status=queued 才能改为 running）认领任务，多进程部署时也不会重复执行
+- 执行中的任务超过 INSIGHT_JOB_STALE_SECONDS 未更新，视为进程已退出，重新排队
+"""
+import asyncio
+from datetime import datetime, timedelta
+from typing import List, Optional, Set
+from app.config import settings
+from app.database import SessionLocal
+from app.models.joy_card import JoyCard
+from app.models.insight_job import InsightJob, JobStatus
+from app.services.insight_service import InsightService
+from app.i18n.state import get_language, set_language
+
+_workers: List[asyncio.Task] = []
+# 本进程正在执行的任务，不参与超时重新排队
+_running_ids: Set[str] = set()
+_wakeup: Optional[asyncio.Event] = None
+
+
+class InsightJobService:
+    """定律生成任务的入队、认领与执行"""
+
+    @staticmethod
+    def enqueue(db, user_id: str) -> InsightJob:
+        """为用户创建生成任务；已有排队或执行中的任务时直接返回该任务"""
+        job = db.query(InsightJob).filter(
+            InsightJob.user_id == user_id,
+            InsightJob.status.in_([JobStatus.QUEUED, JobStatus.RUNNING])
+        ).order_by(InsightJob.created_at).first()
+        if job is not None:
+            return job
+
+        job = InsightJob(user_id=user_id, language=get_language())
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+
+        if _wakeup is not None:
+            _wakeup.set()
+        return job
+
+    @staticmethod
+    def start_workers() -> None:
+        """启动 worker 池（应用启动时调用）"""
+        global _wakeup
+        _wakeup = asyncio.Event()
+        InsightJobService._requeue_stale()
+        for _ in range(settings.INSIGHT_JOB_WORKERS):
+            _workers.append(asyncio.create_task(InsightJobService._worker_loop()))
+
+    @staticmethod
+    async def stop_workers() -> None:
+        """停止 worker 池；执行中的任务保持 running，超过 INSIGHT_JOB_STALE_SECONDS 后由任一进程重新排队"""
+        for task in _workers:
+            task.cancel()
+        await asyncio.gather(*_workers, return_exceptions=True)
+        _workers.clear()
+
+    @staticmethod
+    async def _worker_loop() -> None:
+        while True:
+            try:
+                _wakeup.clear()
+                job_id = InsightJobService._claim_next()
+                if job_id is None:
+                    try:
+                        await asyncio.wait_for(_wakeup.wait(), timeout=settings.INSIGHT_JOB_POLL_SECONDS)
+                    except asyncio.TimeoutError:
+                        InsightJobService._requeue_stale()
+                    continue
+                _running_ids.add(job_id)
+                try:
+                    await InsightJobService._run(job_id)
+                finally:
+                    _running_ids.discard(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # worker 本身不能退出，出错后稍等再继续
+                print(f"定律任务 worker 出错: {str(e)}")
+                await asyncio.sleep(settings.INSIGHT_JOB_POLL_SECONDS)
+
+    @staticmethod
+    def _claim_next() -> Optional[str]:
+        """认领最早排队的任务，返回任务 id；没有可执行的任务返回 None"""
+        db = SessionLocal()
+        try:
+            while True:
+                job = db.query(InsightJob).filter(
+                    InsightJob.status == JobStatus.QUEUED
+                ).order_by(InsightJob.created_at).first()
+                if job is None:
+                    return None
+                claimed = db.query(InsightJob).filter(
+                    InsightJob.id == job.id,
+                    InsightJob.status == JobStatus.QUEUED
+                ).update({
+                    "status": JobStatus.RUNNING,
+                    "started_at": datetime.utcnow(),
+                    "updated_at": datetime.utcnow(),
+                    "attempts": InsightJob.attempts + 1
+                }, synchronize_session=False)
+                db.commit()
+                if claimed:
+                    return job.id
+                # 被其他 worker 抢先认领，取下一个
+                db.expire_all()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _requeue_stale() -> None:
+        """
+        执行中但长时间未更新的任务重新排队，超过最多尝试次数的标记为失败
+
+        启动时同样只处理超时的任务：其他进程正在执行的任务仍在持续更新，不能抢走
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.INSIGHT_JOB_STALE_SECONDS)
+        db = SessionLocal()
+        try:
+            query = db.query(InsightJob).filter(
+                InsightJob.status == JobStatus.RUNNING,
+                InsightJob.updated_at < cutoff,
+                InsightJob.id.notin_(_running_ids)
+            )
+            for job in query.all():
+                if (job.attempts or 0) >= settings.INSIGHT_JOB_MAX_ATTEMPTS:
+                    job.status = JobStatus.FAILED
+                    job.error = "任务多次中断"
+                    job.finished_at = datetime.utcnow()
+                else:
+                    print(f"定律任务 {job.id} 执行中断，重新排队")
+                    job.status = JobStatus.QUEUED
+            db.commit()
+        finally:
+            db.close()
+
+    @staticmethod
+    async def _run(job_id: str) -> None:
+        db = SessionLocal()
+        try:
+            job = db.get(InsightJob, job_id)
+            user_id = job.user_id
+            language = job.language
+            cards = db.query(JoyCard).filter(JoyCard.user_id == user_id).all()
+        finally:
+            db.close()
+
+        # 只作用于本 worker 任务的上下文，之后创建的生成任务会复制这一语言
+        set_language(language)
+        insight_ids = []
+        try:
+            if len(cards) < 5:
+                raise ValueError(f"需要至少5张卡片才能生成定律，当前有{len(cards)}张")
+            async for insight_id in InsightService.astream_for_user(user_id, cards):
+                insight_ids.append(insight_id)
+                InsightJobService._update(job_id, progress=len(insight_ids), insight_ids=list(insight_ids))
+            InsightJobService._update(job_id, status=JobStatus.SUCCEEDED, finished_at=datetime.utcnow())
+        except Exception as e:
+            print(f"定律任务 {job_id} 失败: {str(e)}")
+            InsightJobService._update(job_id, status=JobStatus.FAILED, error=str(e), finished_at=datetime.utcnow())
+
+    @staticmethod
+    def _update(job_id: str, **values) -> None:
+        db = SessionLocal()
+        try:
+            job = db.get(InsightJob, job_id)
+            for name, value in values.items():
+                setattr(job, name, value)
+            db.commit()
+        finally:
+            db.close()
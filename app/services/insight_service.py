@@ -1,12 +1,107 @@
-from typing import List, Dict
-from app.services.ai_service import ai_service
+import asyncio
+import hashlib
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import AsyncIterator, Callable, List, Dict, Optional, Set, Tuple
+from sqlalchemy.orm import undefer
+from app.config import settings
+from app.database import SessionLocal
+from app.services.ai_router import ai_service
+from app.services.ai_scheduler import PRIORITY_BACKGROUND
+from app.services.cache import TTLCache
+from app.services.tokens import estimate_tokens
+from app.services.prompt_format import format_cards, prompt_stats
+from app.services.structured_output import INSIGHTS_OUTPUT, INSIGHT_PATTERNS_OUTPUT, parse_json
 from app.models.joy_card import JoyCard
+from app.models.joy_insight import JoyInsight
+from app.models.insight_generation import InsightGeneration
 from app.i18n.state import get_language
-from app.i18n.translations import INSIGHT_GENERATION_PROMPT, INSIGHT_SYSTEM_PROMPT
+from app.i18n.translations import (
+    INSIGHT_GENERATION_PROMPT, INSIGHT_INCREMENTAL_PROMPT, INSIGHT_SYSTEM_PROMPT,
+    INSIGHT_MAP_SYSTEM_PROMPT, INSIGHT_MAP_PROMPT, INSIGHT_REDUCE_PROMPT
+)
 import json
 import re
 
 
+# (用户, 卡片集合摘要, 语言) -> 该次生成后用户的定律 id 列表（增量生成时为当前全部定律）
+_generation_memo = TTLCache(maxsize=settings.INSIGHT_MEMO_SIZE, ttl=settings.INSIGHT_MEMO_TTL_SECONDS)
+# 发送给 AI 的卡片表格列
+_CARD_COLUMNS = ("id", "summary", "raw_input", "scene", "people", "event", "trigger", "sensation")
+# 用户 -> 进行中的生成任务，同一用户的并发请求共享同一次生成
+_inflight_generations: Dict[str, asyncio.Task] = {}
+
+
+@dataclass
+class _GenerationPlan:
+    mode: str  # "full" | "incremental" | "unchanged"（没有新卡片，直接返回当前的定律）
+    system_prompt: str = ""
+    prompt: str = ""
+    card_ids: List[str] = field(default_factory=list)
+    started_at: Optional[datetime] = None
+    existing_ids: Set[str] = field(default_factory=set)
+    insight_ids: List[str] = field(default_factory=list)
+    # 卡片超出单次预算时走 map-reduce：每个分片一个 map 提示词，reduce 时附上已有定律表
+    map_prompts: List[str] = field(default_factory=list)
+    insights_table: str = "-"
+    lang: str = "en"
+
+
+class _InsightArrayParser:
+    """增量解析回复中的 "insights": [...] 数组：每个元素对象闭合时立即返回"""
+
+    _ARRAY_START = re.compile(r'"insights"\s*:\s*\[')
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._in_array = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._start = 0
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """追加一段回复，返回本段中闭合的数组元素"""
+        self._buffer += chunk
+        items = []
+        if not self._in_array:
+            match = self._ARRAY_START.search(self._buffer)
+            if match is None:
+                return items
+            self._in_array = True
+            self._pos = match.end()
+
+        while self._pos < len(self._buffer) and not self._done:
+            ch = self._buffer[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == '{':
+                if self._depth == 0:
+                    self._start = self._pos
+                self._depth += 1
+            elif ch == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        items.append(json.loads(self._buffer[self._start:self._pos + 1]))
+                    except json.JSONDecodeError:
+                        # 无法解析的条目直接跳过
+                        pass
+            elif ch == ']' and self._depth == 0:
+                self._done = True
+            self._pos += 1
+        return items
+
+
 class InsightService:
     """快乐定律生成服务"""
 
@@ -21,42 +116,397 @@ class InsightService:
         Returns:
             生成的定律列表
         """
-        if len(cards) < 5:
-            raise ValueError("需要至少5张卡片才能生成定律")
-
-        # 构建卡片数据
-        cards_data = []
-        for card in cards:
-            cards_data.append({
-                "id": card.id,
-                "summary": card.card_summary,
-                "raw_input": card.raw_input,
-                "formula": {
-                    "scene": card.formula_scene,
-                    "people": card.formula_people,
-                    "event": card.formula_event,
-                    "trigger": card.formula_trigger,
-                    "sensation": card.formula_sensation
-                }
-            })
-
-        cards_json = json.dumps(cards_data, ensure_ascii=False, indent=2)
-
-        lang = get_language()
-        prompt = INSIGHT_GENERATION_PROMPT[lang].format(cards_json=cards_json)
+        system_prompt, prompt = InsightService._build_prompt(cards)
 
         # 调用AI
         ai_reply = ai_service.chat(
-            system_prompt=INSIGHT_SYSTEM_PROMPT[lang],
+            system_prompt=system_prompt,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.8,
-            max_tokens=8000
+            max_tokens=8000,
+            schema=INSIGHTS_OUTPUT
         )
 
         # 提取JSON
         insights = InsightService._extract_insights(ai_reply)
         return insights
 
+    @staticmethod
+    async def astream_for_user(user_id: str, cards: List[JoyCard]) -> AsyncIterator[str]:
+        """
+        生成并保存用户的定律，每条定律保存后立即产出其 id
+
+        - 卡片集合未变化时直接返回当前的定律（去掉之后被否决的），不再调用 AI
+        - 同一用户的并发请求合并到同一次生成（命中记忆或加入他人发起的生成时，结果到齐后一次性产出）
+        - 已有定律时走增量模式，只发送上次生成之后新增/修改的卡片
+        """
+        key = (user_id, InsightService._cards_digest(cards), get_language())
+        memo = _generation_memo.get(key)
+        if memo is not None:
+            for insight_id in InsightService._active_insight_ids(user_id, memo.value):
+                yield insight_id
+            return
+
+        task = _inflight_generations.get(user_id)
+        if task is not None:
+            for insight_id in await asyncio.shield(task):
+                yield insight_id
+            return
+
+        plan = InsightService._plan_generation(user_id, cards)
+        if plan.mode == "unchanged":
+            for insight_id in plan.insight_ids:
+                yield insight_id
+            return
+
+        queue: asyncio.Queue = asyncio.Queue()
+        task = InsightService._start_generation(user_id, key, plan, queue.put_nowait)
+        # 生成结束（含失败）时放入结束标记
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        while True:
+            insight_id = await queue.get()
+            if insight_id is None:
+                break
+            yield insight_id
+        # 生成失败时在这里抛出
+        task.result()
+
+    @staticmethod
+    def _start_generation(user_id: str, key: Tuple, plan: "_GenerationPlan",
+                          on_insight: Optional[Callable[[str], None]] = None) -> asyncio.Task:
+        task = asyncio.create_task(InsightService._generate_and_save(user_id, key, plan, on_insight))
+        _inflight_generations[user_id] = task
+
+        def _forget(done_task: asyncio.Task) -> None:
+            if _inflight_generations.get(user_id) is done_task:
+                del _inflight_generations[user_id]
+
+        task.add_done_callback(_forget)
+        return task
+
+    @staticmethod
+    def _plan_generation(user_id: str, cards: List[JoyCard]) -> "_GenerationPlan":
+        """决定全量还是增量生成，并构建对应的提示词"""
+        started_at = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            generations = db.query(InsightGeneration).filter(
+                InsightGeneration.user_id == user_id
+            ).order_by(InsightGeneration.created_at).all()
+            existing = db.query(JoyInsight).options(undefer(JoyInsight.evidence_cards)).filter(
+                JoyInsight.user_id == user_id,
+                JoyInsight.is_rejected == False  # noqa: E712
+            ).order_by(JoyInsight.created_at).all()
+
+            if not settings.INSIGHT_INCREMENTAL_ENABLED or not generations or not existing:
+                plan = _GenerationPlan("full", card_ids=[card.id for card in cards], started_at=started_at)
+                return InsightService._with_prompts(plan, cards, [])
+
+            # 卡片 id -> 最近一次覆盖它的生成时间；之后更新过的卡片需要重新分析
+            covered_at = {}
+            for generation in generations:
+                for card_id in generation.card_ids or []:
+                    covered_at[card_id] = generation.created_at
+            new_cards = [
+                card for card in cards
+                if card.id not in covered_at or (card.updated_at and card.updated_at > covered_at[card.id])
+            ]
+
+            if not new_cards:
+                # 增量生成只记录本次新建/更新的定律，结果应为用户当前全部（未否决的）定律
+                return _GenerationPlan("unchanged", insight_ids=[insight.id for insight in existing])
+
+            plan = _GenerationPlan(
+                "incremental", card_ids=[card.id for card in new_cards], started_at=started_at,
+                existing_ids={insight.id for insight in existing}
+            )
+            return InsightService._with_prompts(plan, new_cards, existing)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _with_prompts(plan: "_GenerationPlan", cards: List[JoyCard],
+                      existing: List[JoyInsight]) -> "_GenerationPlan":
+        """卡片在单次预算内时构建单个提示词，否则按预算分片构建 map 提示词"""
+        plan.lang = get_language()
+        chunks = InsightService._chunk_cards(cards)
+        if len(chunks) > 1:
+            plan.system_prompt = INSIGHT_MAP_SYSTEM_PROMPT[plan.lang]
+            for chunk in chunks:
+                cards_table = format_cards(chunk, _CARD_COLUMNS)
+                prompt = INSIGHT_MAP_PROMPT[plan.lang].format(cards_table=cards_table)
+                prompt_stats.record("insight_map", plan.system_prompt, {"cards": cards_table}, prompt)
+                plan.map_prompts.append(prompt)
+            plan.insights_table = InsightService._insights_table(existing) if existing else "-"
+        elif plan.mode == "incremental":
+            plan.system_prompt, plan.prompt = InsightService._build_incremental_prompt(cards, existing)
+        else:
+            plan.system_prompt, plan.prompt = InsightService._build_prompt(cards)
+        return plan
+
+    @staticmethod
+    def _chunk_cards(cards: List[JoyCard]) -> List[List[JoyCard]]:
+        """按 INSIGHT_CHUNK_TOKEN_BUDGET 把卡片顺序切分，单张超预算的卡片独占一片"""
+        budget = settings.INSIGHT_CHUNK_TOKEN_BUDGET
+        chunks, current, used = [], [], 0
+        for card in cards:
+            # 只计数据行，不计表头
+            cost = estimate_tokens(format_cards([card], _CARD_COLUMNS).split("\n", 1)[1])
+            if current and used + cost > budget:
+                chunks.append(current)
+                current, used = [], 0
+            current.append(card)
+            used += cost
+        if current:
+            chunks.append(current)
+        return chunks
+
+    @staticmethod
+    async def _generate_and_save(user_id: str, key: Tuple, plan: "_GenerationPlan",
+                                 on_insight: Optional[Callable[[str], None]] = None) -> List[str]:
+        """
+        流式调用 AI，每条定律在回复中闭合后立即保存
+
+        Args:
+            on_insight: 每保存一条定律时以其 id 回调（供流式接口推送）
+        """
+        system_prompt, prompt = plan.system_prompt, plan.prompt
+        if plan.map_prompts:
+            prompt = await InsightService._amap(plan, user_id)
+            system_prompt = INSIGHT_SYSTEM_PROMPT[plan.lang]
+            if prompt is None:
+                return []
+
+        insight_ids = []
+        removed_ids = set()
+        parsed = 0
+        async for insight_data in InsightService._astream_insights(system_prompt, prompt, user_id):
+            parsed += 1
+            insight_id = InsightService._save_insight(user_id, insight_data, plan, removed_ids)
+            if insight_id is None or insight_id in insight_ids:
+                continue
+            insight_ids.append(insight_id)
+            if on_insight is not None:
+                on_insight(insight_id)
+
+        if parsed:
+            # 回复无法解析时不记录覆盖，下次重新分析这些卡片
+            db = SessionLocal()
+            try:
+                db.add(InsightGeneration(
+                    user_id=user_id,
+                    mode=plan.mode,
+                    card_ids=plan.card_ids,
+                    insight_ids=insight_ids,
+                    created_at=plan.started_at
+                ))
+                db.commit()
+            finally:
+                db.close()
+
+        if insight_ids:
+            # 增量生成只产出本次新建/更新的定律，记忆中保存用户当前全部定律，与 unchanged 分支一致
+            memo_ids = InsightService._active_insight_ids(user_id) if plan.mode == "incremental" else insight_ids
+            _generation_memo.set(key, memo_ids)
+        return insight_ids
+
+    @staticmethod
+    def _active_insight_ids(user_id: str, insight_ids: Optional[List[str]] = None) -> List[str]:
+        """用户当前未否决的定律 id；传入 insight_ids 时只保留其中仍存在且未否决的，顺序不变"""
+        db = SessionLocal()
+        try:
+            query = db.query(JoyInsight.id).filter(
+                JoyInsight.user_id == user_id,
+                JoyInsight.is_rejected == False  # noqa: E712
+            )
+            if insight_ids is None:
+                return [row.id for row in query.order_by(JoyInsight.created_at)]
+            active = {row.id for row in query.filter(JoyInsight.id.in_(insight_ids))}
+            return [insight_id for insight_id in insight_ids if insight_id in active]
+        finally:
+            db.close()
+
+    @staticmethod
+    async def _astream_insights(system_prompt: str, prompt: str, user_id: str) -> AsyncIterator[Dict]:
+        """边接收回复边解析 "insights" 数组，每个元素闭合时产出；增量解析失败时整段回复兜底解析"""
+        parser = _InsightArrayParser()
+        parts = []
+        emitted = 0
+        async for chunk in ai_service.astream(
+            system_prompt=system_prompt,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.8,
+            max_tokens=8000,
+            user_id=user_id,
+            priority=PRIORITY_BACKGROUND,
+            schema=INSIGHTS_OUTPUT
+        ):
+            parts.append(chunk)
+            for insight_data in parser.feed(chunk):
+                emitted += 1
+                yield insight_data
+
+        if not emitted:
+            for insight_data in InsightService._extract_insights("".join(parts)):
+                yield insight_data
+
+    @staticmethod
+    def _save_insight(user_id: str, insight_data: Dict, plan: "_GenerationPlan",
+                      removed_ids: Set[str]) -> Optional[str]:
+        """保存单条定律（增量模式下可能是更新已有定律），返回其 id；无效条目返回 None"""
+        db = SessionLocal()
+        try:
+            if plan.mode == "incremental":
+                insight = InsightService._apply_incremental(db, user_id, insight_data, plan.existing_ids, removed_ids)
+            else:
+                insight = InsightService._new_insight(db, user_id, insight_data)
+            if insight is None:
+                return None
+            db.flush()
+            insight_id = insight.id
+            db.commit()
+            return insight_id
+        finally:
+            db.close()
+
+    @staticmethod
+    def _new_insight(db, user_id: str, insight_data: Dict) -> Optional[JoyInsight]:
+        if not insight_data.get("insight"):
+            return None
+        insight = JoyInsight(
+            user_id=user_id,
+            insight_text=insight_data["insight"],
+            statement=insight_data.get("statement"),
+            keywords=insight_data.get("keywords"),
+            pattern_type=insight_data.get("pattern_type"),
+            evidence_cards=insight_data.get("evidence", [])
+        )
+        db.add(insight)
+        return insight
+
+    @staticmethod
+    def _apply_incremental(db, user_id: str, insight_data: Dict, existing_ids: Set[str],
+                           removed_ids: Set[str]) -> Optional[JoyInsight]:
+        """把增量回复中的一条应用到已有定律：带 id 的更新原定律（证据追加），merged_ids 中未确认的定律删除，否则新建"""
+        insight_id = insight_data.get("id")
+        if insight_id in removed_ids:
+            # 引用了本次已被合并掉的定律
+            return None
+        if insight_id not in existing_ids:
+            return InsightService._new_insight(db, user_id, insight_data)
+
+        insight = db.get(JoyInsight, insight_id)
+        if insight is None:
+            return None
+        evidence = list(insight.evidence_cards or [])
+        merged_ids = [i for i in insight_data.get("merged_ids") or [] if i in existing_ids and i != insight_id]
+        for merged in db.query(JoyInsight).options(undefer(JoyInsight.evidence_cards)).filter(
+            JoyInsight.id.in_(merged_ids)
+        ).all():
+            if merged.is_confirmed:
+                # 已确认的定律不会被合并掉
+                continue
+            evidence.extend(merged.evidence_cards or [])
+            db.delete(merged)
+            removed_ids.add(merged.id)
+        evidence.extend(insight_data.get("evidence", []))
+
+        seen_cards = set()
+        insight.evidence_cards = [
+            item for item in evidence
+            if item.get("card_id") not in seen_cards and not seen_cards.add(item.get("card_id"))
+        ]
+        insight.insight_text = insight_data.get("insight") or insight.insight_text
+        insight.statement = insight_data.get("statement") or insight.statement
+        insight.keywords = insight_data.get("keywords") or insight.keywords
+        insight.pattern_type = insight_data.get("pattern_type") or insight.pattern_type
+        return insight
+
+    @staticmethod
+    async def _amap(plan: "_GenerationPlan", user_id: str) -> Optional[str]:
+        """各分片并发提取候选模式（INSIGHT_MAP_CONCURRENCY 限制并发），返回归并候选的 reduce 提示词；没有候选时返回 None"""
+        semaphore = asyncio.Semaphore(settings.INSIGHT_MAP_CONCURRENCY)
+
+        async def map_chunk(prompt: str) -> List[Dict]:
+            async with semaphore:
+                ai_reply = await ai_service.achat(
+                    system_prompt=plan.system_prompt,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.5,
+                    max_tokens=2000,
+                    user_id=user_id,
+                    priority=PRIORITY_BACKGROUND,
+                    schema=INSIGHT_PATTERNS_OUTPUT
+                )
+            return InsightService._extract_json_list(ai_reply, "patterns")
+
+        results = await asyncio.gather(*(map_chunk(prompt) for prompt in plan.map_prompts), return_exceptions=True)
+        candidates = []
+        errors = []
+        for result in results:
+            if isinstance(result, Exception):
+                # 个别分片失败不影响整体，只是少了这部分候选
+                print(f"定律候选提取失败: {str(result)}")
+                errors.append(result)
+            else:
+                candidates.extend(result)
+        if len(errors) == len(results):
+            raise errors[0]
+        if not candidates:
+            return None
+
+        candidates_json = json.dumps(candidates, ensure_ascii=False, separators=(",", ":"))
+        prompt = INSIGHT_REDUCE_PROMPT[plan.lang].format(
+            insights_table=plan.insights_table,
+            candidates_json=candidates_json
+        )
+        prompt_stats.record(
+            "insight_reduce", INSIGHT_SYSTEM_PROMPT[plan.lang],
+            {"insights": plan.insights_table, "candidates": candidates_json}, prompt
+        )
+        return prompt
+
+    @staticmethod
+    def _cards_digest(cards: List[JoyCard]) -> str:
+        """卡片集合摘要（id + 更新时间，与顺序无关）"""
+        parts = sorted(f"{card.id}:{card.updated_at}" for card in cards)
+        return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _build_prompt(cards: List[JoyCard]) -> Tuple[str, str]:
+        """构建定律生成的 (系统提示词, 用户提示词)"""
+        if len(cards) < 5:
+            raise ValueError("需要至少5张卡片才能生成定律")
+
+        lang = get_language()
+        cards_table = format_cards(cards, _CARD_COLUMNS)
+        prompt = INSIGHT_GENERATION_PROMPT[lang].format(cards_table=cards_table)
+        prompt_stats.record("insight", INSIGHT_SYSTEM_PROMPT[lang], {"cards": cards_table}, prompt)
+        return INSIGHT_SYSTEM_PROMPT[lang], prompt
+
+    @staticmethod
+    def _build_incremental_prompt(new_cards: List[JoyCard], existing: List[JoyInsight]) -> Tuple[str, str]:
+        """构建增量生成的提示词：已有定律每条一行，只附新卡片"""
+        lang = get_language()
+        insights_table = InsightService._insights_table(existing)
+        cards_table = format_cards(new_cards, _CARD_COLUMNS)
+        prompt = INSIGHT_INCREMENTAL_PROMPT[lang].format(insights_table=insights_table, cards_table=cards_table)
+        prompt_stats.record(
+            "insight_incremental", INSIGHT_SYSTEM_PROMPT[lang],
+            {"insights": insights_table, "cards": cards_table}, prompt
+        )
+        return INSIGHT_SYSTEM_PROMPT[lang], prompt
+
+    @staticmethod
+    def _insights_table(existing: List[JoyInsight]) -> str:
+        rows = []
+        for insight in existing:
+            status = "confirmed" if insight.is_confirmed else "pending"
+            keywords = ", ".join(insight.keywords or [])
+            statement = (insight.statement or insight.insight_text).replace("\n", " ")
+            rows.append(f"{insight.id} | {status} | {statement} | {keywords} | {len(insight.evidence_cards or [])}")
+        return "\n".join(rows)
+
     @staticmethod
     def _extract_json_by_braces(text: str, start: int) -> str | None:
         """从 start 位置的 '{' 开始，找到匹配的闭合 '}'，返回完整 JSON 字符串"""
@@ -89,17 +539,27 @@ class InsightService:
     @staticmethod
     def _extract_insights(ai_reply: str) -> List[Dict]:
         """从AI回复中提取定律JSON"""
+        return InsightService._extract_json_list(ai_reply, "insights")
+
+    @staticmethod
+    def _extract_json_list(ai_reply: str, key: str) -> List[Dict]:
+        """从AI回复中提取 {key: [...]} 形式的JSON列表"""
         if not ai_reply:
             print("[DEBUG] AI reply is empty")
             return []
 
+        # Structured output: the whole reply is the JSON object
+        data = parse_json(ai_reply)
+        if isinstance(data, dict):
+            return data.get(key, [])
+
         # Strategy 1: ```json ... ``` complete code block
         json_match = re.search(r'```json\s*(.*?)\s*```', ai_reply, re.DOTALL)
         if json_match:
             try:
                 data = json.loads(json_match.group(1))
-                print(f"[DEBUG] Parsed from code block, insights count: {len(data.get('insights', []))}")
-                return data.get("insights", [])
+                print(f"[DEBUG] Parsed from code block, {key} count: {len(data.get(key, []))}")
+                return data.get(key, [])
             except json.JSONDecodeError as e:
                 print(f"[DEBUG] JSON decode failed (code block): {e}")
 
@@ -114,22 +574,22 @@ class InsightService:
                 if json_str:
                     try:
                         data = json.loads(json_str)
-                        print(f"[DEBUG] Parsed from code block (balanced braces), insights count: {len(data.get('insights', []))}")
-                        return data.get("insights", [])
+                        print(f"[DEBUG] Parsed from code block (balanced braces), {key} count: {len(data.get(key, []))}")
+                        return data.get(key, [])
                     except json.JSONDecodeError as e:
                         print(f"[DEBUG] JSON decode failed (code block balanced): {e}")
 
-        # Strategy 3: find "insights" keyword anywhere and extract JSON via balanced braces
-        insights_pos = ai_reply.find('"insights"')
-        if insights_pos != -1:
-            start = ai_reply.rfind('{', 0, insights_pos)
+        # Strategy 3: find the key anywhere and extract JSON via balanced braces
+        key_pos = ai_reply.find(f'"{key}"')
+        if key_pos != -1:
+            start = ai_reply.rfind('{', 0, key_pos)
             if start != -1:
                 json_str = InsightService._extract_json_by_braces(ai_reply, start)
                 if json_str:
                     try:
                         data = json.loads(json_str)
-                        print(f"[DEBUG] Parsed from balanced braces, insights count: {len(data.get('insights', []))}")
-                        return data.get("insights", [])
+                        print(f"[DEBUG] Parsed from balanced braces, {key} count: {len(data.get(key, []))}")
+                        return data.get(key, [])
                     except json.JSONDecodeError as e:
                         print(f"[DEBUG] JSON decode failed (balanced): {e}")
 
@@ -0,0 +1,53 @@
+"""
+键集（游标）分页
+
+列表按 (created_at, id) 倒序排列，游标是上一页最后一行的 (created_at, id)，编码为不透明字符串。
+下一页查询 WHERE (created_at, id) < 游标，直接从 (user_id, created_at DESC, id DESC) 索引定位，
+耗时与翻到第几页无关；id 保证 created_at 相同的行顺序稳定、不重复不遗漏。
+"""
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+
+
+def encode_cursor(created_at: datetime, row_id: str) -> str:
+    raw = json.dumps([created_at.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """解析游标；格式不正确时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), str(row_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"invalid cursor: {cursor!r}") from e
+
+
+def keyset_page(query: Query, created_column, id_column, limit: int,
+                cursor: Optional[str] = None, offset: int = 0) -> Tuple[List, Optional[str]]:
+    """
+    按 (created_at, id) 倒序取一页
+
+    query 为已按用户过滤的查询（实体或列投影均可）；传入 cursor 时从游标之后开始，
+    否则按 offset 跳过（兼容 skip/limit）。多取一行判断是否还有下一页。
+
+    Returns:
+        (本页的行, 下一页游标；没有更多数据时为 None)
+    """
+    if cursor:
+        query = query.filter(tuple_(created_column, id_column) < tuple_(*decode_cursor(cursor)))
+    query = query.order_by(created_column.desc(), id_column.desc())
+    if offset and not cursor:
+        query = query.offset(offset)
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(getattr(last, created_column.key), getattr(last, id_column.key))
+    return rows[:limit], next_cursor
@@ -0,0 +1,113 @@
+"""
+提示词中的紧凑数据格式，以及按区块统计的提示词体积
+
+卡片等结构化数据以「首行字段名 + 每行一条」的表格发送，不再逐条重复 JSON 键名和缩进；
+raw_input 去掉与 card_summary 重复的内容后按 PROMPT_RAW_INPUT_TOKEN_BUDGET 截断。
+"""
+import threading
+from typing import Dict, List, Optional, Sequence
+from app.config import settings
+from app.models.joy_card import JoyCard
+from app.services.tokens import estimate_tokens, truncate_to_tokens
+
+# 表格列名 -> 卡片取值
+_CARD_FIELDS = {
+    "id": lambda card: card.id,
+    "summary": lambda card: card.card_summary,
+    "raw_input": lambda card: compact_raw_input(card.raw_input, card.card_summary),
+    "scene": lambda card: card.formula_scene,
+    "people": lambda card: card.formula_people,
+    "event": lambda card: card.formula_event,
+    "trigger": lambda card: card.formula_trigger,
+    "sensation": lambda card: card.formula_sensation,
+}
+
+
+def _cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        value = ", ".join(str(item) for item in value)
+    # 分隔符和换行会破坏行列结构
+    return str(value).replace("|", "/").replace("\r", " ").replace("\n", " / ").strip()
+
+
+def format_table(columns: Sequence[str], rows: List[Sequence]) -> str:
+    """首行为列名、字段以 | 分隔的紧凑表格"""
+    lines = ["|".join(columns)]
+    lines.extend("|".join(_cell(value) for value in row) for row in rows)
+    return "\n".join(lines)
+
+
+def compact_raw_input(raw_input: Optional[str], summary: Optional[str]) -> str:
+    """去掉已包含在摘要中的用户发言，再截断到 PROMPT_RAW_INPUT_TOKEN_BUDGET"""
+    if not raw_input:
+        return ""
+    summary_text = (summary or "").strip()
+    turns = [turn.strip() for turn in raw_input.split("\n") if turn.strip()]
+    kept = [turn for turn in turns if not summary_text or turn not in summary_text]
+    return truncate_to_tokens(" / ".join(kept), settings.PROMPT_RAW_INPUT_TOKEN_BUDGET)
+
+
+def format_cards(cards: List[JoyCard], columns: Sequence[str]) -> str:
+    return format_table(columns, [[_CARD_FIELDS[column](card) for column in columns] for card in cards])
+
+
+class PromptStats:
+    """按请求类型累计提示词字符数与估算 token 数，并按区块（系统提示词、说明、各数据段）拆分"""
+
+    def __init__(self):
+        self._stats: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, system_prompt: str, sections: Dict[str, str],
+               prompt: Optional[str] = None) -> None:
+        """
+        Args:
+            kind: 请求类型（如 insight、exploration、chat）
+            sections: 区块名 -> 该区块文本
+            prompt: 完整的用户提示词；提供时，除各数据区块外的部分计为 instructions
+        """
+        breakdown = {"system": (len(system_prompt), estimate_tokens(system_prompt))}
+        for name, text in sections.items():
+            breakdown[name] = (len(text), estimate_tokens(text))
+        if prompt is not None:
+            breakdown["instructions"] = (
+                len(prompt) - sum(len(text) for text in sections.values()),
+                max(estimate_tokens(prompt) - sum(estimate_tokens(text) for text in sections.values()), 0)
+            )
+
+        total_chars = sum(chars for chars, _ in breakdown.values())
+        total_tokens = sum(tokens for _, tokens in breakdown.values())
+        with self._lock:
+            stats = self._stats.setdefault(kind, {"calls": 0, "chars": 0, "tokens": 0, "sections": {}})
+            stats["calls"] += 1
+            stats["chars"] += total_chars
+            stats["tokens"] += total_tokens
+            for name, (chars, tokens) in breakdown.items():
+                section = stats["sections"].setdefault(name, {"chars": 0, "tokens": 0})
+                section["chars"] += chars
+                section["tokens"] += tokens
+
+    def snapshot(self) -> Dict:
+        """各请求类型的平均提示词体积（字符数 / 估算 token 数）"""
+        with self._lock:
+            return {
+                kind: {
+                    "calls": stats["calls"],
+                    "avg_chars": stats["chars"] // stats["calls"],
+                    "avg_tokens": stats["tokens"] // stats["calls"],
+                    "sections": {
+                        name: {
+                            "avg_chars": section["chars"] // stats["calls"],
+                            "avg_tokens": section["tokens"] // stats["calls"],
+                        }
+                        for name, section in stats["sections"].items()
+                    },
+                }
+                for kind, stats in self._stats.items()
+            }
+
+
+# 全局提示词体积统计
+prompt_stats = PromptStats()
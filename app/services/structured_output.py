@@ -0,0 +1,111 @@
+"""
+结构化输出：把 pydantic 模型转换为各提供商的约束输出参数
+
+两种模式：
+- json：整段回复必须是符合 schema 的 JSON（定律生成、探索推荐）
+  Anthropic 强制调用同名工具，OpenAI 使用 response_format json_schema，Gemini 使用 response_schema
+- tool：回复仍是自由文本，模型需要时额外调用工具提交结构化数据（对话中的快乐公式）
+  AIService 把工具参数还原为回复末尾的 ```json 代码块，下游解析与历史存储格式保持不变
+
+不支持约束输出的提供商（custom）照常返回文本，调用方的正则解析作为兜底
+"""
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Type
+from pydantic import BaseModel
+from app.schemas.joy_card import FormulaResult
+from app.schemas.joy_insight import InsightDraftList, InsightPatternList
+from app.schemas.exploration import RecommendationList
+
+# Gemini 的 Schema 只支持 OpenAPI 子集
+_GEMINI_SCHEMA_KEYS = {"type", "format", "description", "nullable", "enum", "properties", "required", "items"}
+
+
+@dataclass
+class OutputSchema:
+    """一种结构化输出：工具/schema 名称、说明、来源模型与模式"""
+    name: str
+    description: str
+    model: Type[BaseModel]
+    mode: str = "json"  # json | tool
+    json_schema: Dict = field(init=False)
+
+    def __post_init__(self):
+        self.json_schema = json_schema(self.model)
+
+
+def json_schema(model: Type[BaseModel]) -> Dict:
+    """pydantic 模型的 JSON Schema，$ref 展开为内联定义，去掉 title"""
+    schema = model.model_json_schema()
+    definitions = schema.pop("$defs", {})
+
+    def resolve(node):
+        if isinstance(node, dict):
+            if "$ref" in node:
+                return resolve(definitions[node["$ref"].split("/")[-1]])
+            return {key: resolve(value) for key, value in node.items() if key != "title"}
+        if isinstance(node, list):
+            return [resolve(item) for item in node]
+        return node
+
+    return resolve(schema)
+
+
+def gemini_schema(schema: Dict) -> Dict:
+    """转换为 Gemini 支持的子集：Optional（anyOf + null）改为 nullable，const 改为 enum"""
+    schema = dict(schema)
+    variants = schema.pop("anyOf", None)
+    if variants:
+        non_null = [variant for variant in variants if variant.get("type") != "null"]
+        schema.update(non_null[0] if non_null else {"type": "string"})
+        if len(non_null) < len(variants):
+            schema["nullable"] = True
+    if "const" in schema:
+        schema["enum"] = [schema.pop("const")]
+
+    result = {key: value for key, value in schema.items() if key in _GEMINI_SCHEMA_KEYS}
+    if "properties" in result:
+        result["properties"] = {name: gemini_schema(value) for name, value in result["properties"].items()}
+    if "items" in result:
+        result["items"] = gemini_schema(result["items"])
+    return result
+
+
+def render_tool_call(data: Dict) -> str:
+    """tool 模式下把工具参数还原为 ```json 代码块，追加在回复文本之后"""
+    return f"```json\n{json.dumps(data, ensure_ascii=False, indent=2)}\n```"
+
+
+def parse_json(reply: str) -> Optional[Any]:
+    """结构化输出的回复整体就是 JSON；不是合法 JSON 时返回 None，由调用方走正则兜底"""
+    try:
+        return json.loads(reply.strip())
+    except (ValueError, AttributeError):
+        return None
+
+
+FORMULA_OUTPUT = OutputSchema(
+    name="submit_joy_formula",
+    description="Submit the completed joy formula once all five elements are clear. "
+                "Use this instead of writing the JSON block in the reply.",
+    model=FormulaResult,
+    mode="tool",
+)
+
+INSIGHTS_OUTPUT = OutputSchema(
+    name="joy_insights",
+    description="Joy theorems discovered from the user's joy cards.",
+    model=InsightDraftList,
+)
+
+INSIGHT_PATTERNS_OUTPUT = OutputSchema(
+    name="joy_patterns",
+    description="Candidate joy patterns found in one chunk of joy cards.",
+    model=InsightPatternList,
+)
+
+RECOMMENDATIONS_OUTPUT = OutputSchema(
+    name="joy_recommendations",
+    description="Recommended actions for the user's current energy level.",
+    model=RecommendationList,
+)
@@ -0,0 +1,215 @@
+"""
+本地 stub AI 提供商：不访问外部服务，按提示词类型返回模板化的确定性回复
+
+用于离线压测整条链路（API、数据库写入、并发限制）。延迟分布、错误注入和流式分片均可配置，见 config.py 中的 STUB_* 配置。
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from typing import AsyncIterator, Dict, List
+from app.config import settings
+from app.i18n.translations import (
+    JOY_COACH_SYSTEM_PROMPT, INSIGHT_SYSTEM_PROMPT, INSIGHT_MAP_SYSTEM_PROMPT,
+    EXPLORATION_SYSTEM_PROMPT, HISTORY_SUMMARY_SYSTEM_PROMPT
+)
+
+
+class StubProviderError(Exception):
+    """stub 注入的错误，带 HTTP 状态码以模拟提供商的 429/5xx"""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"stub provider injected error (HTTP {status_code})")
+        self.status_code = status_code
+
+
+# 系统提示词 -> (请求类型, 语言)
+_PROMPT_KINDS = {}
+for _kind, _prompts in (
+    ("coach", JOY_COACH_SYSTEM_PROMPT),
+    ("insight", INSIGHT_SYSTEM_PROMPT),
+    ("insight_map", INSIGHT_MAP_SYSTEM_PROMPT),
+    ("exploration", EXPLORATION_SYSTEM_PROMPT),
+    ("summary", HISTORY_SUMMARY_SYSTEM_PROMPT),
+):
+    for _lang, _prompt in _prompts.items():
+        _PROMPT_KINDS[_prompt] = (_kind, _lang)
+
+_FOLLOW_UPS = {
+    "zh": ["哈哈，听起来不错！当时还有谁在？", "那一刻最打动你的是什么？", "是什么让你想去做这件事的？"],
+    "en": ["Ha, nice! Who else was there?", "What moved you most in that moment?", "What made you want to do it?"],
+}
+
+
+class StubProvider:
+    """模板化回复的假提供商，接口与各 SDK 的调用方式无关，由 AIService 直接调用"""
+
+    def __init__(self):
+        # 延迟与错误注入使用独立的随机源（按 STUB_SEED 初始化，便于复现压测）
+        self._rng = random.Random(settings.STUB_SEED)
+        self._rng_lock = threading.Lock()
+
+    # ── 调用入口 ──────────────────────────────────────
+
+    def chat(self, system_prompt: str, messages: List[Dict[str, str]],
+             temperature: float = 0.7, max_tokens: int = 2000, schema=None) -> str:
+        delay = self._sample_latency()
+        self._maybe_fail()
+        time.sleep(delay)
+        return self._shape(self.reply(system_prompt, messages), schema)
+
+    async def achat(self, system_prompt: str, messages: List[Dict[str, str]],
+                    temperature: float = 0.7, max_tokens: int = 2000, schema=None) -> str:
+        delay = self._sample_latency()
+        self._maybe_fail()
+        await asyncio.sleep(delay)
+        return self._shape(self.reply(system_prompt, messages), schema)
+
+    async def astream(self, system_prompt: str, messages: List[Dict[str, str]],
+                      temperature: float = 0.7, max_tokens: int = 2000, schema=None) -> AsyncIterator[str]:
+        """首个分片前等待采样延迟（模拟首 token 时间），之后按固定间隔下发分片"""
+        delay = self._sample_latency()
+        self._maybe_fail()
+        await asyncio.sleep(delay)
+
+        text = self._shape(self.reply(system_prompt, messages), schema)
+        size = max(settings.STUB_STREAM_CHUNK_CHARS, 1)
+        for start in range(0, len(text), size):
+            if start:
+                await asyncio.sleep(settings.STUB_STREAM_CHUNK_DELAY_MS / 1000)
+            yield text[start:start + size]
+
+    @staticmethod
+    def _shape(text: str, schema) -> str:
+        """模拟结构化输出：json 模式只返回代码块中的 JSON；tool 模式的模板回复本身已是 文本 + 代码块"""
+        if schema is None or schema.mode != "json":
+            return text
+        match = re.search(r'```json\s*(.*?)\s*```', text, re.DOTALL)
+        return match.group(1) if match else text
+
+    # ── 延迟与错误注入 ──────────────────────────────────
+
+    def _sample_latency(self) -> float:
+        """按配置的分布采样延迟（秒）"""
+        mean = settings.STUB_LATENCY_MS / 1000
+        spread = settings.STUB_LATENCY_SPREAD
+        with self._rng_lock:
+            if settings.STUB_LATENCY_DISTRIBUTION == "uniform":
+                # spread 为相对幅度：mean * (1 ± spread)
+                return max(mean * self._rng.uniform(1 - spread, 1 + spread), 0.0)
+            if settings.STUB_LATENCY_DISTRIBUTION == "lognormal":
+                # 中位数为 mean，spread 为对数标准差（长尾）
+                return mean * self._rng.lognormvariate(0, spread) if mean > 0 else 0.0
+            return mean
+
+    def _maybe_fail(self) -> None:
+        if settings.STUB_ERROR_RATE <= 0:
+            return
+        with self._rng_lock:
+            failed = self._rng.random() < settings.STUB_ERROR_RATE
+            status_code = self._rng.choice((429, 500, 503))
+        if failed:
+            raise StubProviderError(status_code)
+
+    # ── 模板回复 ──────────────────────────────────────
+
+    def reply(self, system_prompt: str, messages: List[Dict[str, str]]) -> str:
+        """按系统提示词识别请求类型，返回确定性的模板回复"""
+        kind, lang = _PROMPT_KINDS.get(system_prompt, ("unknown", "en"))
+        seed = hashlib.sha256(
+            (system_prompt + json.dumps(messages, ensure_ascii=False)).encode("utf-8")
+        ).hexdigest()
+        rng = random.Random(seed)
+        prompt = messages[-1]["content"] if messages else ""
+
+        if kind == "coach":
+            return self._coach_reply(messages, lang, rng)
+        if kind == "insight":
+            return self._insight_reply(prompt, lang, rng)
+        if kind == "insight_map":
+            return self._insight_map_reply(prompt, lang, rng)
+        if kind == "exploration":
+            return self._exploration_reply(prompt, lang, rng)
+        if kind == "summary":
+            return self._summary_reply(prompt, lang)
+        return "OK"
+
+    @staticmethod
+    def _coach_reply(messages: List[Dict[str, str]], lang: str, rng: random.Random) -> str:
+        user_turns = [msg["content"] for msg in messages if msg["role"] == "user"]
+        if len(user_turns) < settings.STUB_FORMULA_AFTER_TURNS:
+            return rng.choice(_FOLLOW_UPS[lang])
+
+        last = user_turns[-1][:40]
+        first = user_turns[0][:40]
+        formula = {
+            "stage": "complete",
+            "formula": {
+                "scene": first,
+                "people": "朋友" if lang == "zh" else "Friends",
+                "event": last,
+                "trigger": first,
+                "sensation": last,
+            },
+            "card_summary": first,
+        }
+        lead = "我发现了一些东西：" if lang == "zh" else "I spotted something:"
+        return f"{lead}\n```json\n{json.dumps(formula, ensure_ascii=False, indent=2)}\n```"
+
+    @staticmethod
+    def _insight_reply(prompt: str, lang: str, rng: random.Random) -> str:
+        # 卡片表格每行开头的 id，或 reduce 阶段候选模式证据中的 "card_id"
+        card_ids = list(dict.fromkeys(
+            re.findall(r'^([0-9a-f-]{36})\|', prompt, re.MULTILINE)
+            + re.findall(r'"card_id":\s*"([0-9a-f-]{36})"', prompt)
+        ))
+        # 增量生成：提示词中列出了已有定律，细化第一条
+        existing_ids = re.findall(r'^(\S+) \| (?:confirmed|pending) \|', prompt, re.MULTILINE)
+        insights = []
+        for index in range(2):
+            evidence_ids = rng.sample(card_ids, min(3, len(card_ids)))
+            insights.append({
+                "insight": f"Stub insight {index + 1}" if lang == "en" else f"示例定律 {index + 1}",
+                "statement": "Small shared moments bring joy" if lang == "en" else "和朋友分享的小事带来快乐",
+                "keywords": ["stub", "load-test", f"pattern-{index + 1}"],
+                "evidence": [{"card_id": card_id, "quote": "..."} for card_id in evidence_ids],
+                "pattern_type": "stub",
+            })
+            if index == 0 and existing_ids:
+                insights[0]["id"] = existing_ids[0]
+        return f"```json\n{json.dumps({'insights': insights}, ensure_ascii=False, indent=2)}\n```"
+
+    @staticmethod
+    def _insight_map_reply(prompt: str, lang: str, rng: random.Random) -> str:
+        card_ids = list(dict.fromkeys(re.findall(r'^([0-9a-f-]{36})\|', prompt, re.MULTILINE)))
+        patterns = [{
+            "statement": "Small shared moments bring joy" if lang == "en" else "和朋友分享的小事带来快乐",
+            "keywords": ["stub", "load-test"],
+            "pattern_type": "stub",
+            "evidence": [{"card_id": card_id, "quote": "..."} for card_id in rng.sample(card_ids, min(2, len(card_ids)))],
+        }]
+        return f"```json\n{json.dumps({'patterns': patterns}, ensure_ascii=False)}\n```"
+
+    @staticmethod
+    def _exploration_reply(prompt: str, lang: str, rng: random.Random) -> str:
+        energy_match = re.search(r'(\d+)\s*/\s*10', prompt)
+        energy = energy_match.group(1) if energy_match else "?"
+        recommendations = [
+            {
+                "title": f"Stub action {index + 1}" if lang == "en" else f"示例行动 {index + 1}",
+                "description": "Take a short walk outside" if lang == "en" else "出门散步十分钟",
+                "related_insight": None,
+                "energy_match": f"energy {energy}/10",
+                "confidence": rng.randint(5, 9),
+            }
+            for index in range(3)
+        ]
+        return f"```json\n{json.dumps({'recommendations': recommendations}, ensure_ascii=False, indent=2)}\n```"
+
+    @staticmethod
+    def _summary_reply(prompt: str, lang: str) -> str:
+        lead = "对话摘要：" if lang == "zh" else "Summary:"
+        return f"{lead} {prompt[-300:]}"
@@ -0,0 +1,116 @@
+import re
+from typing import Dict, List, Optional, Tuple
+from app.config import settings
+from app.services.ai_router import ai_service
+from app.services.tokens import estimate_tokens, estimate_messages_tokens
+from app.i18n.translations import (
+    HISTORY_SUMMARY_SYSTEM_PROMPT, HISTORY_SUMMARY_REQUEST, HISTORY_SUMMARY_PREFIX
+)
+
+_FORMULA_BLOCK_PATTERN = re.compile(r'```json\s*\{.*?\}\s*```', re.DOTALL)
+
+
+class HistoryBudget:
+    """
+    对话历史 token 预算
+
+    历史在预算内时原样发送；超出预算时，把最近 CHAT_HISTORY_KEEP_TURNS 轮之前的消息
+    折叠进滚动摘要（存于 ChatSession），发送 [摘要] + 其后的原文消息。
+    摘要只在再次超出预算时推进，两次摘要之间发送的前缀保持不变，便于提供商侧缓存。
+
+    summary 结构：{"text": "...", "message_count": 摘要覆盖的前 N 条消息}
+    """
+
+    @staticmethod
+    def prepare(messages: List[Dict[str, str]], summary: Optional[Dict],
+                lang: str) -> Tuple[List[Dict[str, str]], Optional[Dict]]:
+        """返回 (发送给 AI 的消息, 更新后的摘要)"""
+        summary = HistoryBudget._valid_summary(messages, summary)
+        split = HistoryBudget._plan(messages, summary)
+        if split is not None:
+            system_prompt, request = HistoryBudget._summary_request(messages, summary, split, lang)
+            try:
+                text = ai_service.chat(system_prompt, request, temperature=0.3, max_tokens=1000)
+                summary = HistoryBudget._new_summary(messages, split, text)
+            except Exception as e:
+                # 摘要失败不影响本轮对话，沿用旧摘要
+                print(f"历史摘要生成失败: {str(e)}")
+        return HistoryBudget._context(messages, summary, lang), summary
+
+    @staticmethod
+    async def aprepare(messages: List[Dict[str, str]], summary: Optional[Dict], lang: str,
+                       user_id: Optional[str] = None) -> Tuple[List[Dict[str, str]], Optional[Dict]]:
+        """prepare 的异步版本"""
+        summary = HistoryBudget._valid_summary(messages, summary)
+        split = HistoryBudget._plan(messages, summary)
+        if split is not None:
+            system_prompt, request = HistoryBudget._summary_request(messages, summary, split, lang)
+            try:
+                text = await ai_service.achat(system_prompt, request, temperature=0.3, max_tokens=1000,
+                                              user_id=user_id)
+                summary = HistoryBudget._new_summary(messages, split, text)
+            except Exception as e:
+                print(f"历史摘要生成失败: {str(e)}")
+        return HistoryBudget._context(messages, summary, lang), summary
+
+    @staticmethod
+    def _valid_summary(messages: List[Dict[str, str]], summary: Optional[Dict]) -> Optional[Dict]:
+        if not summary or not summary.get("text"):
+            return None
+        if summary.get("message_count", 0) > len(messages):
+            return None
+        return summary
+
+    @staticmethod
+    def _plan(messages: List[Dict[str, str]], summary: Optional[Dict]) -> Optional[int]:
+        """超出预算时返回新摘要应覆盖到的位置，否则返回 None"""
+        covered = summary["message_count"] if summary else 0
+        context_tokens = estimate_messages_tokens(messages[covered:])
+        if summary:
+            context_tokens += estimate_tokens(summary["text"])
+        if context_tokens <= settings.CHAT_HISTORY_TOKEN_BUDGET:
+            return None
+
+        # 保留最近 N 轮原文；切分点对齐到 assistant 消息，使 [摘要(user)] 之后角色交替
+        split = len(messages) - settings.CHAT_HISTORY_KEEP_TURNS * 2
+        while split > covered and messages[split]["role"] != "assistant":
+            split -= 1
+        if split <= covered:
+            # 最近几轮本身已超预算，只能原样发送
+            return None
+        return split
+
+    @staticmethod
+    def _summary_request(messages: List[Dict[str, str]], summary: Optional[Dict],
+                         split: int, lang: str) -> Tuple[str, List[Dict[str, str]]]:
+        covered = summary["message_count"] if summary else 0
+        transcript = "\n".join(
+            f"{msg['role']}: {msg['content']}" for msg in messages[covered:split]
+        )
+        request = HISTORY_SUMMARY_REQUEST[lang].format(
+            summary=summary["text"] if summary else "-",
+            transcript=transcript
+        )
+        return HISTORY_SUMMARY_SYSTEM_PROMPT[lang], [{"role": "user", "content": request}]
+
+    @staticmethod
+    def _new_summary(messages: List[Dict[str, str]], split: int, text: str) -> Dict:
+        # 被折叠的消息中最近一次输出的公式原样附在摘要后，保证后续更新公式时要素不丢失
+        for msg in reversed(messages[:split]):
+            if msg["role"] == "assistant":
+                formula_match = _FORMULA_BLOCK_PATTERN.search(msg["content"])
+                if formula_match:
+                    text = f"{text.strip()}\n\n{formula_match.group(0)}"
+                    break
+        return {"text": text.strip(), "message_count": split}
+
+    @staticmethod
+    def _context(messages: List[Dict[str, str]], summary: Optional[Dict],
+                 lang: str) -> List[Dict[str, str]]:
+        if not summary:
+            return messages
+        summary_message = {
+            "role": "user",
+            "content": HISTORY_SUMMARY_PREFIX[lang].format(summary=summary["text"])
+        }
+        return [summary_message] + messages[summary["message_count"]:]
@@ -0,0 +1,33 @@
+"""本地 token 估算（不依赖提供商的 tokenizer）"""
+import re
+from typing import Dict, List, Optional
+
+# 中日韩字符（含全角标点），大致按 1 字 1 token 估算
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]')
+
+# 每条消息的格式开销（角色标记等）
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """本地估算 token 数：中日韩字符按 1 字 1 token，其余按 4 字符 1 token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def estimate_messages_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(estimate_tokens(msg["content"]) + _MESSAGE_OVERHEAD_TOKENS for msg in messages)
+
+
+def truncate_to_tokens(text: Optional[str], max_tokens: int) -> str:
+    """按本地估算截断到 max_tokens 以内，截断处加省略号"""
+    if not text or estimate_tokens(text) <= max_tokens:
+        return text or ""
+    used = 0.0
+    for index, ch in enumerate(text):
+        used += 1 if _CJK_PATTERN.match(ch) else 0.25
+        if used > max_tokens - 1:
+            return text[:index].rstrip() + "…"
+    return text
@@ -1,5 +1,5 @@
 import apiClient from './client';
-import type { JoyCard, JoyCardListResponse } from '../types';
+import type { JoyCard, JoyCardConversationResponse, JoyCardListResponse } from '../types';
 
 export const cardsApi = {
   /**
@@ -12,6 +12,16 @@ export const cardsApi = {
     return response.data;
   },
 
+  /**
+   * 按游标获取卡片列表：首页不传 cursor，之后传上一页返回的 next_cursor（为 null 表示没有更多）
+   */
+  async getCardsPage(cursor?: string, limit: number = 20, includeTotal: boolean = false): Promise<JoyCardListResponse> {
+    const response = await apiClient.get<JoyCardListResponse>('/api/cards', {
+      params: { cursor, limit, include_total: includeTotal },
+    });
+    return response.data;
+  },
+
   /**
    * 获取单个卡片详情
    */
@@ -20,6 +30,14 @@ export const cardsApi = {
     return response.data;
   },
 
+  /**
+   * 获取生成卡片的完整对话（按需加载）
+   */
+  async getCardConversation(cardId: string): Promise<JoyCardConversationResponse> {
+    const response = await apiClient.get<JoyCardConversationResponse>(`/api/cards/${cardId}/conversation`);
+    return response.data;
+  },
+
   /**
    * 删除卡片
    */
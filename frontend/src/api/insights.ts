@@ -1,23 +1,65 @@
 import apiClient from './client';
-import type { JoyInsight, GenerateInsightsResponse } from '../types';
+import type { JoyInsight, GenerateInsightsResponse, InsightJob } from '../types';
+
+// 轮询生成任务的间隔
+const JOB_POLL_INTERVAL_MS = 1500;
 
 export const insightsApi = {
   /**
    * 生成快乐定律（需要至少 5 张卡片）
+   * 后端在后台执行，这里提交任务后轮询直到完成
    */
   async generateInsights(): Promise<GenerateInsightsResponse> {
-    const response = await apiClient.post<GenerateInsightsResponse>('/api/insights/generate');
+    let { data: job } = await apiClient.post<InsightJob>('/api/insights/generate');
+    while (job.status === 'queued' || job.status === 'running') {
+      await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+      job = await insightsApi.getJob(job.id);
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'Insight generation failed');
+    }
+    return {
+      insights: job.insights,
+      message: `成功生成${job.insights.length}条快乐定律`,
+    };
+  },
+
+  /**
+   * 查询定律生成任务
+   */
+  async getJob(jobId: string): Promise<InsightJob> {
+    const response = await apiClient.get<InsightJob>(`/api/insights/jobs/${jobId}`);
     return response.data;
   },
 
   /**
    * 获取所有定律列表
+   * includeEvidence 为 false 时不返回证据（evidence_cards 为 null），只需要状态或文本时使用
    */
-  async getInsights(): Promise<JoyInsight[]> {
-    const response = await apiClient.get<JoyInsight[]>('/api/insights');
+  async getInsights(includeEvidence: boolean = true): Promise<JoyInsight[]> {
+    const response = await apiClient.get<JoyInsight[]>('/api/insights', {
+      params: includeEvidence ? undefined : { include_evidence: false },
+    });
     return response.data;
   },
 
+  /**
+   * 按游标分页获取定律，下一页游标来自响应头 X-Next-Cursor（没有更多时为 null）
+   */
+  async getInsightsPage(
+    limit: number = 20,
+    cursor?: string,
+    includeEvidence: boolean = true,
+  ): Promise<{ insights: JoyInsight[]; nextCursor: string | null }> {
+    const response = await apiClient.get<JoyInsight[]>('/api/insights', {
+      params: { limit, cursor, include_evidence: includeEvidence },
+    });
+    return {
+      insights: response.data,
+      nextCursor: response.headers['x-next-cursor'] ?? null,
+    };
+  },
+
   /**
    * 确认定律
    */
@@ -871,7 +871,7 @@ export default function HomePage({ onNavigateChat, onNavigateTheorem, onNavigate
         if (response.cards && response.cards.length > 0) {
           setLatestCard(response.cards[0]);
         }
-        setTotalCardCount(response.total);
+        setTotalCardCount(response.total ?? 0);
       } catch (error) {
         console.error('Failed to load latest card:', error);
       } finally {
@@ -885,7 +885,7 @@ export default function HomePage({ onNavigateChat, onNavigateTheorem, onNavigate
   useEffect(() => {
     const loadPendingInsights = async () => {
       try {
-        const insights = await insightsApi.getInsights();
+        const insights = await insightsApi.getInsights(false);
         const pending = insights.filter(item => !item.is_confirmed && !item.is_rejected);
         setPendingInsightCount(pending.length);
       } catch (error) {
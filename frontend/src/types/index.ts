@@ -59,14 +59,20 @@ export interface JoyCard {
   formula_trigger?: string;
   formula_sensation?: string;
   card_summary?: string;
-  conversation_history: ChatMessage[];
+  session_id?: string;
   created_at: string;
   updated_at: string;
 }
 
+export interface JoyCardConversationResponse {
+  card_id: string;
+  messages: ChatMessage[];
+}
+
 export interface JoyCardListResponse {
   cards: JoyCard[];
-  total: number;
+  total: number | null;
+  next_cursor: string | null;
 }
 
 // Insight Types
@@ -77,7 +83,7 @@ export interface JoyInsight {
   statement?: string;
   keywords?: string[];
   pattern_type?: string;
-  evidence_cards: { card_id: string; quote: string }[];
+  evidence_cards?: { card_id: string; quote: string }[] | null;
   is_confirmed: boolean;
   is_rejected: boolean;
   created_at: string;
@@ -89,6 +95,17 @@ export interface GenerateInsightsResponse {
   message: string;
 }
 
+export interface InsightJob {
+  id: string;
+  status: 'queued' | 'running' | 'succeeded' | 'failed';
+  progress: number;
+  insights: JoyInsight[];
+  error?: string | null;
+  created_at: string;
+  started_at?: string | null;
+  finished_at?: string | null;
+}
+
 // Exploration Types
 export interface ExplorationRequest {
   energy_level: number;
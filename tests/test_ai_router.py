@@ -0,0 +1,36 @@
+import asyncio
+from app.services.ai_retry import CircuitBreaker
+from app.services.ai_router import AIRouter
+
+
+def test_cancel_while_queued_releases_probe(monkeypatch):
+    """半开探测在调度器排队时被取消（客户端断开），探测名额要归还"""
+    router = AIRouter(["stub"])
+    breaker = router.breakers["stub"]
+    breaker.state = CircuitBreaker.HALF_OPEN
+
+    queued = asyncio.Event()
+
+    async def acquire(provider, user_id, priority, cost):
+        queued.set()
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(router.scheduler, "acquire", acquire)
+
+    async def consume():
+        async for _ in router.astream("system", [{"role": "user", "content": "hi"}]):
+            pass
+
+    async def run():
+        task = asyncio.create_task(consume())
+        await queued.wait()
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run())
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.check() is True
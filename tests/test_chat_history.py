@@ -0,0 +1,35 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app.models import user, joy_card, joy_insight, chat_session, chat_message, insight_generation, insight_job  # noqa: F401
+from app.models.user import User
+from app.models.chat_session import ChatSession, SessionType
+from app.services.chat_history import ChatHistoryService
+
+
+def _db():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+
+def test_append_to_unflushed_session():
+    """CLI 的做法：db.add(session) 后直接追加开场白，会话尚未 flush"""
+    db = _db()
+    owner = User(user_identifier="cli-user")
+    db.add(owner)
+    db.flush()
+
+    session = ChatSession(user_id=owner.id, session_type=SessionType.CARD_CREATION)
+    db.add(session)
+    ChatHistoryService.append(db, session, [{"role": "assistant", "content": "hi"}])
+    db.commit()
+
+    ChatHistoryService.append(db, session, [
+        {"role": "user", "content": "我去了公园"},
+        {"role": "assistant", "content": "然后呢？"},
+    ])
+    db.commit()
+
+    assert session.message_count == 3
+    assert [msg["content"] for msg in ChatHistoryService.load(db, session.id)] == ["hi", "我去了公园", "然后呢？"]
@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+from app.models import user, joy_card, joy_insight, chat_session, chat_message, insight_generation, insight_job  # noqa: F401
+from app.models.user import User
+from app.models.joy_card import JoyCard
+from app.models.joy_insight import JoyInsight
+from app.services import insight_service
+from app.services.ai_router import AIRouter
+from app.services.insight_service import InsightService
+
+
+def _session_factory():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+def _add_card(db, user_id: str, index: int) -> None:
+    created_at = datetime(2024, 1, 1) + timedelta(days=index)
+    db.add(JoyCard(user_id=user_id, raw_input=f"和朋友去公园 {index}", card_summary=f"公园 {index}",
+                   created_at=created_at, updated_at=created_at))
+    db.commit()
+
+
+def _generate(db, user_id: str) -> list:
+    cards = db.query(JoyCard).filter(JoyCard.user_id == user_id).all()
+
+    async def collect():
+        return [insight_id async for insight_id in InsightService.astream_for_user(user_id, cards)]
+    return asyncio.run(collect())
+
+
+def _current(db, user_id: str) -> set:
+    db.expire_all()
+    return {row.id for row in db.query(JoyInsight.id).filter(
+        JoyInsight.user_id == user_id, JoyInsight.is_rejected == False  # noqa: E712
+    )}
+
+
+def test_unchanged_returns_all_current_insights(monkeypatch):
+    """全量 -> 增量 -> 卡片不变：命中记忆与未命中记忆都返回用户当前全部定律，且去掉之后否决的"""
+    factory = _session_factory()
+    monkeypatch.setattr(insight_service, "SessionLocal", factory)
+    monkeypatch.setattr(insight_service, "ai_service", AIRouter(["stub"]))
+    monkeypatch.setattr(insight_service.settings, "STUB_STREAM_CHUNK_DELAY_MS", 0)
+    insight_service._generation_memo._data.clear()
+
+    db = factory()
+    owner = User(user_identifier="insight-user")
+    db.add(owner)
+    db.commit()
+    for index in range(5):
+        _add_card(db, owner.id, index)
+
+    _generate(db, owner.id)
+    _add_card(db, owner.id, 5)
+    incremental = _generate(db, owner.id)
+    current = _current(db, owner.id)
+    assert set(incremental) < current
+
+    # 命中增量生成写入的记忆
+    assert set(_generate(db, owner.id)) == current
+
+    rejected = db.get(JoyInsight, sorted(current)[0])
+    rejected.is_rejected = True
+    db.commit()
+    assert set(_generate(db, owner.id)) == current - {rejected.id}
+
+    # 记忆过期后由 unchanged 分支返回
+    insight_service._generation_memo._data.clear()
+    assert set(_generate(db, owner.id)) == current - {rejected.id}